@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+"""
+Benchmark loading a synthetic title dataset into the catalog, against adding the movies one at a time.
+Usage: test/bench_catalog.py [rows]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import gzip
+import random
+import resource
+import tempfile
+import time
+
+import tickmeoff.catalog as catalog
+import tickmeoff.db as dbmod
+import tickmeoff.movie as movie
+
+words = ['The', 'Godfather', 'Dark', 'Knight', 'Angry', 'Men', 'List', 'Lord', 'Rings', 'Return', 'King', 'Pulp', 'Fiction',
+        'Good', 'Bad', 'Ugly', 'Fight', 'Club', 'Forrest', 'Gump', 'Inception', 'Empire', 'Strikes', 'Back', 'Matrix',
+        'Léon', 'Amélie', 'Spirited', 'Away', "Schindler's", 'Part', 'II:', '(Rec)', 'Dr.', 'Ōkami', '"Quoted']
+types = ['movie'] * 3 + ['short', 'tvEpisode', 'tvSeries', 'video']
+
+def makedataset(filename, count, seed=1):
+    """ A gzipped tsv of count rows in the title.basics layout, some of them repeats. """
+    rnd = random.Random(seed)
+    with gzip.open(filename, 'wt', encoding='utf-8', compresslevel=1) as f:
+        f.write('tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres\n')
+        for i in range(count):
+            title = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 6)))
+            year = '\\N' if rnd.random() < 0.05 else str(rnd.randint(1900, 2025))
+            f.write('tt{:08}\t{}\t{}\t{}\t0\t{}\t\\N\t{}\tDrama\n'.format(i, rnd.choice(types), title, title, year, rnd.randint(5, 200)))
+
+def peakmb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def onebyone(db, filename, limit):
+    """ The old way, a movie and a commit at a time. """
+    seen = 0
+    for title, year in catalog.readtitles(filename):
+        if movie.getmovie(db, title, year) is None:
+            movie.addmovie(db, title, year, None, 0)
+        db.commit()
+        seen += 1
+        if seen == limit:
+            break
+    return seen
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, 'title.basics.tsv.gz')
+        start = time.perf_counter()
+        makedataset(filename, count)
+        print('generated {} rows ({} bytes) in {:.1f}s'.format(count, os.path.getsize(filename), time.perf_counter() - start))
+        before = peakmb()
+
+        db = dbmod.DB(os.path.join(tmp, 'bulk.db'))
+        start = time.perf_counter()
+        with db.useprofile('bulk'):
+            read, added = catalog.loadtitles(db, filename)
+        bulk = time.perf_counter() - start
+        print('loadtitles: {} titles, {} added in {:.1f}s, {:.0f} titles/s, peak rss {:.0f}MB (was {:.0f}MB, sqlite page cache included)'.format(
+                read, added, bulk, read / bulk, peakmb(), before))
+
+        # One at a time is too slow to run over the lot, so time a slice of it.
+        db = dbmod.DB(os.path.join(tmp, 'single.db'))
+        start = time.perf_counter()
+        seen = onebyone(db, filename, min(read, 20000))
+        single = time.perf_counter() - start
+        print('one at a time: {} titles in {:.1f}s, {:.0f} titles/s, {:.1f}x slower'.format(
+                seen, single, seen / single, (read / bulk) / (seen / single)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#! /usr/bin/env python3
+"""
+Benchmark the hot queries before and after the schema index migration.
+Usage: test/bench_db.py [syncs]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import random
+import tempfile
+import timeit
+import unittest.mock as mock
+
+import tickmeoff.db as dbmod
+import tickmeoff.mediafile as mediafile
+import tickmeoff.movie as movie
+import tickmeoff.tickmeoff as tmo
+
+NMOVIES = 1000
+CHARTSIZE = 250
+
+# The schema before versioning was added, pinned so later migrations don't need winding back.
+schema0 = '''
+CREATE TABLE movie (movieid INTEGER PRIMARY KEY, title TEXT NOT NULL, yearmade INTEGER, notes TEXT, mkey TEXT NOT NULL, whenadded INTEGER NOT NULL);
+CREATE TABLE sync (syncid INTEGER PRIMARY KEY, whensynced INTEGER UNIQUE NOT NULL);
+CREATE TABLE rank (rankid INTEGER PRIMARY KEY, indexnum INTEGER NOT NULL, movieid INTEGER NOT NULL, asat INTEGER NOT NULL,
+        FOREIGN KEY (movieid) REFERENCES movie, FOREIGN KEY (asat) REFERENCES sync(whensynced));
+CREATE TABLE location (locationid INTEGER PRIMARY KEY, pathname TEXT NOT NULL, parentid REFERENCES location);
+CREATE TABLE mediafile (mediafileid INTEGER PRIMARY KEY, filename TEXT NOT NULL, locationid INTEGER NOT NULL REFERENCES location,
+        movieid INTEGER REFERENCES movie, UNIQUE (locationid, filename));
+CREATE TABLE ticks (movieid INTEGER NOT NULL REFERENCES movie, datetime INTEGER, PRIMARY KEY (movieid, datetime));
+CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT, description TEXT);
+INSERT INTO config ('key', 'value', 'description') VALUES ('linkdir', '~/tickmeoff', 'Base chart link directory');
+INSERT INTO config ('key', 'value', 'description') VALUES ('m3ufile', '~/tickmeoff/playlist.m3u', 'Full path to m3u playlist file');
+'''
+
+def populate(db, syncs):
+    """ Fill the db with NMOVIES movies and syncs charts of CHARTSIZE. """
+    rnd = random.Random(1)
+    with db as c:
+        c.executemany('INSERT INTO movie (title, yearmade, notes, whenadded, mkey) VALUES (?, ?, ?, 0, ?)',
+                ((title, 1950 + i % 70, '', movie.makekeytitle(title)) for i, title in ((i, 'Movie Title {}'.format(i)) for i in range(NMOVIES))))
+        c.execute('INSERT INTO location (pathname) VALUES (?)', ('/media',))
+        c.executemany('INSERT INTO mediafile (filename, locationid, movieid) VALUES (?, 1, ?)',
+                (('movie{}.mkv'.format(i), i) for i in range(1, NMOVIES, 2)))
+        for s in range(1, syncs + 1):
+            c.execute('INSERT INTO sync (whensynced) VALUES (?)', (s,))
+            c.executemany('INSERT INTO rank (indexnum, movieid, asat) VALUES (?, ?, ?)',
+                    ((i, m, s) for i, m in enumerate(rnd.sample(range(1, NMOVIES + 1), CHARTSIZE), 1)))
+    db.commit()
+
+def workload(db, asat):
+    for r in tmo.getrankings(db, asat=asat):
+        mediafile.getmediafile(db, movieid=r['movieid'])
+        movie.getmovie(db, r['title'], r['yearmade'])
+        movie.search(db, '{} ({}).mkv'.format(r['title'], r['yearmade']))
+    mediafile.getmediafile(db, filename='movie1.mkv')
+    mediafile.getlocation(db, '/media')
+
+def bench(db, asat, number=5):
+    return min(timeit.repeat(lambda: workload(db, asat), number=1, repeat=number))
+
+def main():
+    syncs = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dbfile = os.path.join(tmpdir, 'bench.db')
+        # An unversioned, unindexed db, as created before the migrations.
+        with mock.patch.object(dbmod.DB, '_loadschema', lambda self: schema0):
+            db = dbmod.DB(dbfile)
+        assert db.version == 0
+        populate(db, syncs)
+        before = bench(db, syncs)
+        db.conn.close()
+        # Reopening migrates the db.
+        db = dbmod.DB(dbfile)
+        after = bench(db, syncs)
+        print('{} syncs, {} rank rows'.format(syncs, syncs * CHARTSIZE))
+        print('unindexed (v0):  {:8.2f} ms'.format(before * 1000))
+        print('indexed (v{}):    {:8.2f} ms'.format(db.version, after * 1000))
+        print('speedup:         {:8.1f}x'.format(before / after))
+
+if __name__ == '__main__':
+    main()
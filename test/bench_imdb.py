@@ -0,0 +1,123 @@
+#! /usr/bin/env python3
+"""
+Benchmark chart parser throughput over the synthetic chart corpus in test/charts.
+Usage: test/bench_imdb.py [--generate]
+    --generate  rewrite the corpus, it's deterministic so only needed if makepage changes.
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import gzip
+import html
+import random
+import timeit
+
+import tickmeoff.imdb as imdb
+
+chartdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'charts')
+sizes = [250, 1000, 10000]
+
+words = ['The', 'Godfather', 'Dark', 'Knight', 'Angry', 'Men', 'List', 'Lord', 'Rings', 'Return', 'King', 'Pulp', 'Fiction',
+        'Good', 'Bad', 'Ugly', 'Fight', 'Club', 'Forrest', 'Gump', 'Inception', 'Empire', 'Strikes', 'Back', 'Matrix',
+        'Goodfellas', 'Cuckoo', 'Nest', 'Seven', 'Samurai', 'Life', 'Beautiful', 'Silence', 'Lambs', 'City', 'God',
+        'Léon', 'Amélie', 'Spirited', 'Away', 'Psycho', 'Usual', 'Suspects', 'Pianist', 'Parasite', 'Intouchables',
+        '&', "Schindler's", 'Wall·E', 'Oldboy', 'Mononoke', 'Vertigo', 'Mädchen', 'Ōkami', 'Star', 'Wars']
+
+def makepage(count, seed=1):
+    """ A chart page of count entries, with the sort of surrounding markup a real chart has. Returns (html, entries). """
+    rnd = random.Random(seed)
+    entries = []
+    rows = []
+    for i in range(1, count + 1):
+        title = ' '.join(rnd.choice(words) for _ in range(rnd.randint(1, 5)))
+        year = rnd.randint(1920, 2023)
+        info = '{} (dir.), {}, {}'.format(*(rnd.choice(words) for _ in range(3)))
+        entries.append((title, year, info))
+        rows.append('''      <tr>
+        <td class="posterColumn">
+          <span name="rk" data-value="{i}"></span>
+          <span name="ir" data-value="{rating}"></span>
+          <a href="/title/tt{i:07}/"><img src="https://example.org/images/{i}.jpg" width="45" height="67" alt="{etitle}"/></a>
+        </td>
+        <td class="titleColumn">
+          {i}.
+          <a href="/title/tt{i:07}/" title="{einfo}">{etitle}</a>
+          <span class="secondaryInfo">({year})</span>
+        </td>
+        <td class="ratingColumn imdbRating">
+          <strong title="{rating} based on {votes} user ratings">{rating}</strong>
+        </td>
+        <td class="ratingColumn"><div class="seen-widget seen-widget-tt{i:07} pending" data-titleid="tt{i:07}"><div class="inline">
+          <div class="pending"></div><div class="unseeable">NOT YET RELEASED</div><div class="unseen">{i}</div>
+        </div></div></td>
+        <td class="watchlistColumn"><div class="wlb_ribbon" data-tconst="tt{i:07}" data-recordmetrics="true"></div></td>
+      </tr>
+'''.format(i=i, etitle=html.escape(title), einfo=html.escape(info), year=year, rating=rnd.randint(80, 93) / 10, votes=rnd.randint(10000, 2000000)))
+    nav = ''.join('<li class="nav-item"><a href="/section/{0}/" data-ref="nav_{0}">Section {0}</a></li>\n'.format(n) for n in range(200))
+    script = 'var config = {};\n'.format(repr({'k{}'.format(n): n for n in range(500)}))
+    page = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+  <meta charset="utf-8">
+  <title>Top Rated Movies</title>
+  <script>{script}</script>
+</head>
+<body>
+  <nav><ul>
+{nav}  </ul></nav>
+  <div id="main">
+    <table class="chart full-width" data-caller-name="chart-top250movie">
+      <thead><tr><th></th><th>Rank &amp; Title</th><th>Rating</th><th>Your Rating</th><th></th></tr></thead>
+      <tbody class="lister-list">
+{rows}      </tbody>
+    </table>
+  </div>
+  <footer><p>&copy; synthetic chart</p></footer>
+</body>
+</html>
+'''.format(script=script, nav=nav, rows=''.join(rows))
+    return page, entries
+
+def corpusfile(count):
+    return os.path.join(chartdir, 'chart-{}.html.gz'.format(count))
+
+def generate():
+    os.makedirs(chartdir, exist_ok=True)
+    for count in sizes:
+        page, entries = makepage(count)
+        # mtime=0 so regenerating gives the same bytes.
+        with open(corpusfile(count), 'wb') as f, gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+            gz.write(page.encode('utf-8'))
+        print('wrote {} ({} bytes)'.format(corpusfile(count), len(page)))
+
+def loadpage(count):
+    with gzip.open(corpusfile(count), 'rb') as f:
+        return f.read().decode('utf-8')
+
+def parse(cls, page):
+    parser = cls()
+    parser.feed(page)
+    parser.close()
+    return list(parser)
+
+def main():
+    if '--generate' in sys.argv[1:]:
+        generate()
+        return
+    print('{:>6} {:>10} {:>12} {:>12} {:>8}'.format('rows', 'bytes', 'html.parser', 'fast', 'speedup'))
+    for count in sizes:
+        page = loadpage(count)
+        assert parse(imdb.ChartParser, page) == parse(imdb.FastChartParser, page) == makepage(count)[1]
+        slow = min(timeit.repeat(lambda: parse(imdb.ChartParser, page), number=1, repeat=3))
+        fast = min(timeit.repeat(lambda: parse(imdb.FastChartParser, page), number=1, repeat=3))
+        print('{:6} {:10} {:10.1f}ms {:10.1f}ms {:7.1f}x'.format(count, len(page), slow * 1000, fast * 1000, slow / fast))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#! /usr/bin/env python3
+"""
+Micro-benchmark EnumArgument completion and parsing against large option lists.
+Usage: test/bench_menu.py [sizes...]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import random
+import time
+import timeit
+
+import tickmeoff.menu as menu
+
+words = ['the', 'godfather', 'dark', 'knight', 'lord', 'rings', 'return', 'king', 'pulp', 'fiction', 'good', 'bad', 'ugly', 'fight', 'club']
+
+def makeopts(size):
+    rnd = random.Random(size)
+    return ['{} {} {}'.format(rnd.choice(words), rnd.choice(words), i) for i in range(size)]
+
+def percall(func, number):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+def main():
+    sizes = [int(x) for x in sys.argv[1:]] or [10000, 100000, 1000000]
+    print('{:>8} {:>10} {:>12} {:>12} {:>12}'.format('options', 'index ms', 'partial us', 'exact us', 'parse us'))
+    for size in sizes:
+        opts = makeopts(size)
+        arg = menu.EnumArgument(opts=opts)
+        start = time.perf_counter()
+        arg.index
+        build = time.perf_counter() - start
+        target = opts[size // 2]
+        # Narrow partial match, exact match plus a remainder and a full parse.
+        partial = percall(lambda: arg.getoptions(target[:-1]), 100)
+        exact = percall(lambda: arg.getoptions(target + ' extra'), 100)
+        parse = percall(lambda: arg.parse(target + ' extra'), 100)
+        print('{:8} {:10.1f} {:12.1f} {:12.1f} {:12.1f}'.format(size, build * 1000, partial * 1e6, exact * 1e6, parse * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+#! /usr/bin/env python3
+"""
+Benchmark directory completion listings: listdir plus a stat per entry, against the
+single pass scandir listing and its mtime keyed cache.
+Usage: test/bench_menuls.py [entries]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import tempfile
+import timeit
+
+import tickmeoff.menuls as mls
+
+def statls(path):
+    """ The listdir/isdir/isfile listing, twice over the directory like the old ls. """
+    dirs = [x + os.path.sep for x in os.listdir(path) if os.path.isdir(os.path.join(path, x))]
+    files = [x for x in os.listdir(path) if os.path.isfile(os.path.join(path, x))]
+    return dirs + files
+
+def percall(func, number=20):
+    return min(timeit.repeat(func, number=number, repeat=3)) / number
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i in range(entries):
+            if i % 2:
+                os.mkdir(os.path.join(tmpdir, 'dir{}'.format(i)))
+            else:
+                open(os.path.join(tmpdir, 'file{}.mkv'.format(i)), 'w').close()
+        assert sorted(statls(tmpdir)) == sorted(mls.ls(tmpdir))
+        print('{} entries'.format(entries))
+        print('listdir + stat:   {:8.3f} ms'.format(percall(lambda: statls(tmpdir)) * 1000))
+        print('scandir:          {:8.3f} ms'.format(percall(lambda: mls.scan(tmpdir)) * 1000))
+        cache = mls.DirCache(ttl=0)
+        print('cached (mtime):   {:8.3f} ms'.format(percall(lambda: cache.listing(tmpdir)) * 1000))
+        cache = mls.DirCache()
+        print('cached (ttl):     {:8.3f} ms'.format(percall(lambda: cache.listing(tmpdir)) * 1000))
+
+if __name__ == '__main__':
+    main()
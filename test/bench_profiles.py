@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+"""
+Compare the db performance profiles on import, scan and report workloads.
+Usage: test/bench_profiles.py [imports]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import tempfile
+import time
+import unittest.mock as mock
+
+import tickmeoff.db as dbmod
+import tickmeoff.mediafile as mediafile
+import tickmeoff.tickmeoff as tmo
+
+CHARTSIZE = 250
+
+def chart(n):
+    # Each chart shares half its entries with the previous one.
+    return [('Movie Title {}'.format(i), 1950 + i % 70, '') for i in range(n * CHARTSIZE // 2, n * CHARTSIZE // 2 + CHARTSIZE)]
+
+def importload(db, imports):
+    for n in range(imports):
+        with mock.patch.object(tmo.time, 'time', return_value=n + 1):
+            tmo._import(db, chart(n))
+        # Each sync is committed separately, like the shell does.
+        db.commit()
+
+def makemedia(basedir, imports):
+    for i in range(0, (imports + 1) * CHARTSIZE // 2, 3):
+        d = os.path.join(basedir, 'dir{}'.format(i % 50))
+        os.makedirs(d, exist_ok=True)
+        open(os.path.join(d, 'Movie Title {} ({}).mkv'.format(i, 1950 + i % 70)), 'w').close()
+
+def scanload(db, basedir):
+    mediafile.addlocation(db, basedir)
+    mediafile.scanpaths(db)
+    db.commit()
+
+def reportload(db, imports):
+    for n in range(1, imports + 1):
+        for r in tmo.getrankings(db, asat=n):
+            mediafile.getmediafile(db, movieid=r['movieid'])
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    imports = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with tempfile.TemporaryDirectory() as tmpdir:
+        mediadir = os.path.join(tmpdir, 'media')
+        makemedia(mediadir, imports)
+        print('{:8} {:>10} {:>10} {:>10}'.format('profile', 'import s', 'scan s', 'report s'))
+        for profile in sorted(dbmod.profiles):
+            dbfile = os.path.join(tmpdir, '{}.db'.format(profile))
+            db = dbmod.DB(dbfile, profile=profile)
+            results = (timed(importload, db, imports), timed(scanload, db, mediadir), timed(reportload, db, imports))
+            print('{:8} {:10.3f} {:10.3f} {:10.3f}'.format(profile, *results))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#! /usr/bin/env python3
+"""
+Benchmark the chart reports against the old per ranking lookups, counting queries as well as time.
+Usage: test/bench_report.py [movies]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import random
+import timeit
+
+import tickmeoff.db as dbmod
+import tickmeoff.mediafile as mediafile
+import tickmeoff.movie as movie
+import tickmeoff.report as report
+import tickmeoff.tickmeoff as tmo
+
+CHARTSIZE = 250
+
+def populate(db, nmovies):
+    """ nmovies movies, every other one with media in its own subdir, and a chart of CHARTSIZE. """
+    rnd = random.Random(1)
+    with db as c:
+        c.executemany('INSERT INTO movie (title, yearmade, notes, whenadded, mkey) VALUES (?, ?, ?, 0, ?)',
+                ((title, 1950 + i % 70, '', movie.makekeytitle(title)) for i, title in ((i, 'Movie Title {}'.format(i)) for i in range(nmovies))))
+    root = mediafile.addlocation(db, '/media')
+    for i in range(1, nmovies, 2):
+        sub = mediafile.addlocation(db, 'movie{}'.format(i), baselocid=root)
+        mediafile.addmediafile(db, 'movie{}.mkv'.format(i), sub, i)
+    with db as c:
+        c.execute('INSERT INTO sync (whensynced, sourceid) VALUES (1, 1)')
+        c.executemany('INSERT INTO rank (indexnum, movieid, asat) VALUES (?, ?, 1)',
+                enumerate(rnd.sample(range(1, nmovies + 1), CHARTSIZE), 1))
+    db.commit()
+
+def before(db):
+    """ The per ranking lookups the shell commands used to make. """
+    ranked = []
+    missing = []
+    for r in tmo.getrankings(db):
+        mf = mediafile.getmediafile(db, movieid=r['movieid'])
+        if mf is None:
+            missing.append(r)
+        else:
+            ranked.append((r, os.path.join(mediafile.getpathr(db, mf['locationid']), mf['filename'])))
+    return ranked, missing
+
+def after(db):
+    return [(r, r['path']) for r in report.rankedpaths(db)], list(report.missing(db))
+
+def measure(db, func):
+    db.settrace(True)
+    func(db)
+    queries = sum(q['calls'] for q in db.stats.dump()['queries'])
+    db.settrace(False)
+    return queries, min(timeit.repeat(lambda: func(db), number=1, repeat=5))
+
+def main():
+    nmovies = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    db = dbmod.DB(':memory:')
+    populate(db, nmovies)
+    print('{} movies, chart of {}'.format(nmovies, CHARTSIZE))
+    print('{:10} {:>8} {:>10}'.format('', 'queries', 'ms'))
+    for name, func in (('per row', before), ('report', after)):
+        queries, elapsed = measure(db, func)
+        print('{:10} {:8} {:10.2f}'.format(name, queries, elapsed * 1000))
+
+if __name__ == '__main__':
+    main()
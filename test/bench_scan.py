@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+"""
+Benchmark full media scans of a synthetic tree with different worker counts.
+An artificial per directory latency stands in for slow (network/spinning) disks.
+Usage: test/bench_scan.py [dirs] [files per dir] [latency ms]
+"""
+
+## Insert local module path into sys PATH environment var.
+import os
+import sys
+# Strip binary filename and test dir from path to get modpath.
+modpath = os.path.split(os.path.split(os.path.abspath(__file__))[0])[0]
+if modpath not in sys.path:
+    sys.path.insert(0, modpath)
+## End module path insert.
+
+import tempfile
+import time
+import unittest.mock as mock
+
+import tickmeoff.db as dbmod
+import tickmeoff.mediafile as mediafile
+import tickmeoff.tickmeoff as tmo
+
+def title(n):
+    """ Digits in titles would confuse the year matching, so spell the number out in letters. """
+    word = ''
+    while True:
+        n, r = divmod(n, 26)
+        word += chr(ord('a') + r)
+        if n == 0:
+            return 'Movie Title {}'.format(word)
+
+def maketree(basedir, dirs, files):
+    for d in range(dirs):
+        path = os.path.join(basedir, 'disk{}'.format(d % 4), 'dir{}'.format(d))
+        os.makedirs(path)
+        for f in range(files):
+            n = d * files + f
+            open(os.path.join(path, '{} ({}).mkv'.format(title(n), 1950 + n % 70)), 'w').close()
+
+def main():
+    dirs = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+    realscandir = os.scandir
+    def slowscandir(path):
+        time.sleep(latency)
+        return realscandir(path)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        basedir = os.path.join(tmpdir, 'media')
+        maketree(basedir, dirs, files)
+        # Every other file is a charted movie.
+        chart = [(title(n), 1950 + n % 70, '') for n in range(0, dirs * files, 2)]
+        print('{} dirs, {} files, {:.1f} ms latency per directory'.format(dirs, dirs * files, latency * 1000))
+        print('{:>8} {:>10} {:>8}'.format('workers', 'scan s', 'added'))
+        for workers in (1, 2, 4, 8, 16):
+            db = dbmod.DB(os.path.join(tmpdir, 'bench{}.db'.format(workers)))
+            tmo._import(db, chart)
+            mediafile.addlocation(db, basedir)
+            db.commit()
+            with mock.patch.object(os, 'scandir', slowscandir):
+                start = time.perf_counter()
+                added, counts = mediafile.scanpaths(db, workers=workers)
+                elapsed = time.perf_counter() - start
+            print('{:8} {:10.3f} {:8}'.format(workers, elapsed, len(added)))
+
+if __name__ == '__main__':
+    main()
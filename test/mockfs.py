@@ -1,12 +1,39 @@
+import collections
+import contextlib
 import os
+import stat
+import types
 import unittest.mock as mock
 
+class DirEntry:
+    """ Minimal os.DirEntry. """
+
+    def __init__(self, fs, dirpath, name):
+        self._fs = fs
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+
+    def is_dir(self):
+        return self._fs._get_path(self.path) is not None
+
+    def is_file(self):
+        return self._fs._get_path(self.path) is None
+
+    def is_symlink(self):
+        return False
+
 class Filesystem:
 
     def __init__(self, fsdict, home='/'):
         self._fsdict = fsdict
         self._home = home
+        # Directory mtimes in ns, default 0. Use touch() to change one.
+        self.mtimes = {}
+        # Count of mocked filesystem calls, by function name.
+        self.calls = collections.Counter()
         self._mocklistdir = mock.patch.object(os, 'listdir', self.listdir)
+        self._mockscandir = mock.patch.object(os, 'scandir', self.scandir)
+        self._mockstat = mock.patch.object(os, 'stat', self.stat)
         self._mockabspath = mock.patch.object(os.path, 'abspath', self.abspath)
         self._mockexpanduser = mock.patch.object(os.path, 'expanduser', self.expanduser)
         self._mockisdir = mock.patch.object(os.path, 'isdir', self.isdir)
@@ -37,6 +64,7 @@ class Filesystem:
         return res
 
     def listdir(self, path):
+        self.calls['listdir'] += 1
         try:
             d = self._get_path(path)
             res = list(sorted(d.keys()))
@@ -44,7 +72,31 @@ class Filesystem:
             raise FileNotFoundError(path) from None
         return res
 
+    def scandir(self, path):
+        self.calls['scandir'] += 1
+        try:
+            d = self._get_path(path)
+        except KeyError:
+            raise FileNotFoundError(path) from None
+        return contextlib.nullcontext(iter([DirEntry(self, path, x) for x in sorted(d.keys())]))
+
+    def stat(self, path, follow_symlinks=True):
+        self.calls['stat'] += 1
+        try:
+            d = self._get_path(path)
+        except KeyError:
+            raise FileNotFoundError(path) from None
+        mtime = self.mtimes.get(path.rstrip(os.path.sep) or os.path.sep, 0)
+        return types.SimpleNamespace(st_mode=stat.S_IFREG if d is None else stat.S_IFDIR, st_size=0,
+                st_mtime=mtime / 1e9, st_mtime_ns=mtime)
+
+    def touch(self, path):
+        """ Bump the mtime of path, as if its contents had changed. """
+        key = path.rstrip(os.path.sep) or os.path.sep
+        self.mtimes[key] = self.mtimes.get(key, 0) + 1
+
     def isdir(self, path):
+        self.calls['isdir'] += 1
         # path is a dir if it contains a dict.
         try:
             d = self._get_path(path)
@@ -54,6 +106,7 @@ class Filesystem:
         return res
 
     def isfile(self, path):
+        self.calls['isfile'] += 1
         try:
             d = self._get_path(path)
             res = d is None
@@ -71,6 +124,8 @@ class Filesystem:
 
     def __enter__(self):
         self._mocklistdir.start()
+        self._mockscandir.start()
+        self._mockstat.start()
         self._mockabspath.start()
         self._mockexpanduser.start()
         self._mockexists.start()
@@ -79,6 +134,8 @@ class Filesystem:
 
     def __exit__(self, *args, **kwargs):
         self._mocklistdir.stop()
+        self._mockscandir.stop()
+        self._mockstat.stop()
         self._mockabspath.stop()
         self._mockexpanduser.stop()
         self._mockexists.stop()
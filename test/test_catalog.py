@@ -0,0 +1,69 @@
+""" catalog.py unit tests """
+
+# Module under test.
+import tickmeoff.catalog as catalog
+
+import tickmeoff.db as dbmod
+import tickmeoff.movie as movie
+
+import gzip
+
+import pytest
+
+header = 'tconst\ttitleType\tprimaryTitle\toriginalTitle\tisAdult\tstartYear\tendYear\truntimeMinutes\tgenres'
+
+rows = [
+    ('tt0111161', 'movie', 'The Shawshank Redemption', '1994'),
+    ('tt0068646', 'movie', 'The Godfather', '1972'),
+    ('tt0903747', 'tvSeries', 'Breaking Bad', '2008'),
+    ('tt9999999', 'movie', 'Untitled "Project', '\\N'),
+    ('tt0068646', 'movie', 'The Godfather', '1972'),
+    ('tt0071562', 'movie', 'The Godfather: Part II', '1974'),
+    ('tt0050083', 'movie', '12 Angry Men', '1957'),
+    ]
+
+@pytest.fixture
+def dataset(tmp_path):
+    filename = tmp_path / 'title.basics.tsv.gz'
+    with gzip.open(filename, 'wt', encoding='utf-8') as f:
+        print(header, file=f)
+        for tconst, kind, title, year in rows:
+            print('\t'.join((tconst, kind, title, title, '0', year, '\\N', '\\N', 'Drama')), file=f)
+    return str(filename)
+
+def test_readtitles(dataset):
+    assert list(catalog.readtitles(dataset)) == [
+            ('The Shawshank Redemption', 1994),
+            ('The Godfather', 1972),
+            ('The Godfather', 1972),
+            ('The Godfather: Part II', 1974),
+            ('12 Angry Men', 1957),
+            ]
+    assert list(catalog.readtitles(dataset, types=('tvSeries',))) == [('Breaking Bad', 2008)]
+
+@pytest.mark.parametrize('chunksize', [1, 2, 50000])
+def test_loadtitles(dataset, monkeypatch, chunksize):
+    monkeypatch.setattr(catalog, 'chunksize', chunksize)
+    db = dbmod.DB(':memory:')
+    movie.addmovie(db, '12 Angry Men', 1957, '', 0)
+    calls = []
+    assert catalog.loadtitles(db, dataset, progress=lambda *a: calls.append(a)) == (5, 3)
+    assert not db.dirty
+    assert calls[-1] == (5, 3)
+    assert len(calls) == -(-5 // chunksize)
+    assert [(m['title'], m['yearmade'], m['mkey']) for m in movie.getmovies(db)] == [
+            ('12 Angry Men', 1957, '12 angry men'),
+            ('The Godfather', 1972, 'godfather'),
+            ('The Godfather: Part II', 1974, 'godfather ii part'),
+            ('The Shawshank Redemption', 1994, 'redemption shawshank'),
+            ]
+    # Loading again adds nothing.
+    assert catalog.loadtitles(db, dataset) == (5, 0)
+
+def test_loadtitles_keyindex(dataset):
+    """ a key index from before the load sees the loaded movies. """
+    db = dbmod.DB(':memory:')
+    movie.addmovie(db, '12 Angry Men', 1957, '', 0)
+    assert len(movie.getkeyindex(db)) == 1
+    catalog.loadtitles(db, dataset)
+    assert movie.getkeyindex(db).search('godfather', 1972) == (movie.getmovie(db, 'The Godfather', 1972)['movieid'],)
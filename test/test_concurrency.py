@@ -0,0 +1,102 @@
+""" Multi-process db access stress test. """
+
+# Module under test.
+import tickmeoff.db as dbmod
+
+import tickmeoff.dbutil as dbutil
+
+import multiprocessing
+import os
+
+import pytest
+
+WRITERS = 3
+READERS = 3
+SYNCS = 20
+CHARTSIZE = 250
+
+def writer(dbfile, num):
+    d = dbmod.DB(dbfile)
+    for i in range(SYNCS):
+        when = num * 1000 + i
+        # Each sync and its rankings are written in one short transaction.
+        with d.transaction():
+            dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (?)', when)
+            dbutil.insertmany(d, 'INSERT INTO rank (indexnum, movieid, asat) VALUES (?, 1, ?)', ((n, when) for n in range(1, CHARTSIZE + 1)))
+
+def reader(dbfile, queue):
+    d = dbmod.DB(dbfile)
+    # Keep reading until all the writers are done.
+    while True:
+        with d.snapshot() as snap:
+            syncs = dbutil.getone(snap, 'SELECT COUNT(*) FROM sync')[0]
+            ranks = dbutil.getone(snap, 'SELECT COUNT(*) FROM rank')[0]
+        # A snapshot must never see a partial sync.
+        if ranks != syncs * CHARTSIZE:
+            queue.put((syncs, ranks))
+            return
+        if syncs == WRITERS * SYNCS:
+            queue.put(None)
+            return
+
+@pytest.fixture
+def dbfile(tmpdir):
+    path = os.path.join(str(tmpdir), 'stress.db')
+    d = dbmod.DB(path)
+    with d.transaction():
+        dbutil.insert(d, "INSERT INTO movie (title, yearmade, mkey, whenadded) VALUES ('x', 2000, 'x', 0)")
+    d.conn.close()
+    return path
+
+def test_readers_writers(dbfile):
+    ctx = multiprocessing.get_context('fork')
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=writer, args=(dbfile, n)) for n in range(WRITERS)]
+    procs += [ctx.Process(target=reader, args=(dbfile, queue)) for n in range(READERS)]
+    for p in procs:
+        p.start()
+    results = [queue.get(timeout=60) for n in range(READERS)]
+    for p in procs:
+        p.join(timeout=60)
+    assert [p.exitcode for p in procs] == [0] * len(procs)
+    assert results == [None] * READERS
+    d = dbmod.DB(dbfile)
+    assert dbutil.getone(d, 'SELECT COUNT(*) FROM rank')[0] == WRITERS * SYNCS * CHARTSIZE
+
+def test_snapshot_readonly(dbfile):
+    d = dbmod.DB(dbfile)
+    with d.snapshot() as snap:
+        assert snap is not d
+        with pytest.raises(dbmod.sqlite3.OperationalError):
+            dbutil.insert(snap, 'INSERT INTO sync (whensynced) VALUES (1)')
+
+def test_snapshot_dirty(dbfile):
+    """ uncommitted changes are only visible on the writing connection. """
+    d = dbmod.DB(dbfile)
+    dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (1)')
+    with d.snapshot() as snap:
+        assert snap is d
+
+def test_transaction_rollback(dbfile):
+    d = dbmod.DB(dbfile)
+    with pytest.raises(ValueError):
+        with d.transaction():
+            dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (1)')
+            raise ValueError()
+    assert not d.dirty
+    assert dbutil.getone(d, 'SELECT COUNT(*) FROM sync')[0] == 0
+
+def test_savepoint_rollback(dbfile):
+    """ a failed savepoint only undoes its own changes. """
+    d = dbmod.DB(dbfile)
+    with d.transaction():
+        dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (1)')
+        with pytest.raises(ValueError):
+            with d.savepoint():
+                dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (2)')
+                raise ValueError()
+        assert d.dirty
+        with d.savepoint():
+            dbutil.insert(d, 'INSERT INTO sync (whensynced) VALUES (3)')
+    assert not d.dirty
+    assert [r[0] for r in dbutil.getall(d, 'SELECT whensynced FROM sync ORDER BY whensynced')] == [1, 3]
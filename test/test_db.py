@@ -0,0 +1,126 @@
+""" db.py unit tests """
+
+# Module under test.
+import tickmeoff.db as dbmod
+
+import os
+import unittest.mock as mock
+
+import pytest
+
+def indexes(d):
+    return {r['name'] for r in d.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")}
+
+@pytest.fixture
+def dbfile(tmpdir):
+    return os.path.join(str(tmpdir), 'test.db')
+
+def test_newdb_version(dbfile):
+    """ a freshly created db is already at the latest version. """
+    d = dbmod.DB(dbfile)
+    latest = d._loadmigrations()[-1][0]
+    assert d.version == latest
+    # Reloading doesn't need to migrate anything.
+    assert dbmod.DB(dbfile).version == latest
+
+# The schema before versioning was added.
+schema0 = '''
+CREATE TABLE movie (movieid INTEGER PRIMARY KEY, title TEXT NOT NULL, yearmade INTEGER, notes TEXT, mkey TEXT NOT NULL, whenadded INTEGER NOT NULL);
+CREATE TABLE sync (syncid INTEGER PRIMARY KEY, whensynced INTEGER UNIQUE NOT NULL);
+CREATE TABLE rank (rankid INTEGER PRIMARY KEY, indexnum INTEGER NOT NULL, movieid INTEGER NOT NULL, asat INTEGER NOT NULL,
+        FOREIGN KEY (movieid) REFERENCES movie, FOREIGN KEY (asat) REFERENCES sync(whensynced));
+CREATE TABLE location (locationid INTEGER PRIMARY KEY, pathname TEXT NOT NULL, parentid REFERENCES location);
+CREATE TABLE mediafile (mediafileid INTEGER PRIMARY KEY, filename TEXT NOT NULL, locationid INTEGER NOT NULL REFERENCES location,
+        movieid INTEGER REFERENCES movie, UNIQUE (locationid, filename));
+CREATE TABLE ticks (movieid INTEGER NOT NULL REFERENCES movie, datetime INTEGER, PRIMARY KEY (movieid, datetime));
+CREATE TABLE config (key TEXT PRIMARY KEY, value TEXT, description TEXT);
+INSERT INTO config ('key', 'value', 'description') VALUES ('linkdir', '~/tickmeoff', 'Base chart link directory');
+INSERT INTO config ('key', 'value', 'description') VALUES ('m3ufile', '~/tickmeoff/playlist.m3u', 'Full path to m3u playlist file');
+'''
+
+def layout(d):
+    """ Tables with their columns, indexes and config keys. """
+    tables = {}
+    for r in d.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+        tables[r['name']] = [(c['name'], c['type'], c['notnull'], c['pk']) for c in d.conn.execute('PRAGMA table_info({})'.format(r['name']))]
+    return tables, indexes(d), [r['key'] for r in d.conn.execute('SELECT key FROM config ORDER BY key')]
+
+def test_migrate_unversioned(dbfile, tmpdir):
+    """ a pre-versioning db gets migrated to the same layout as a new db. """
+    expected = layout(dbmod.DB(os.path.join(str(tmpdir), 'new.db')))
+    with mock.patch.object(dbmod.DB, '_loadschema', lambda self: schema0):
+        d = dbmod.DB(dbfile)
+    assert d.version == 0
+    d.conn.close()
+    d = dbmod.DB(dbfile)
+    assert d.version == d._loadmigrations()[-1][0]
+    assert layout(d) == expected
+    assert not d.dirty
+
+def test_migrate_locations(dbfile):
+    """ duplicate scan locations are merged and full paths filled in. """
+    with mock.patch.object(dbmod.DB, '_loadschema', lambda self: schema0):
+        d = dbmod.DB(dbfile)
+    d.conn.executescript('''
+        INSERT INTO location (locationid, pathname, parentid) VALUES (1, '~/media', NULL), (2, 'a', 1), (3, 'a', 1), (4, '', 1), (5, 'b/c', 1);
+        INSERT INTO mediafile (filename, locationid) VALUES ('x.mkv', 2), ('y.mkv', 3), ('z.mkv', 4), ('w.mkv', 5);
+        ''')
+    d.conn.close()
+    d = dbmod.DB(dbfile)
+    assert [tuple(r) for r in d.conn.execute('SELECT locationid, fullpath FROM location ORDER BY locationid')] == [
+            (1, '~/media'), (2, '~/media/a'), (4, '~/media'), (5, '~/media/b/c')]
+    assert [tuple(r) for r in d.conn.execute('SELECT filename, locationid FROM mediafile ORDER BY filename')] == [
+            ('w.mkv', 5), ('x.mkv', 2), ('y.mkv', 2), ('z.mkv', 4)]
+
+def test_querystats():
+    d = dbmod.DB(':memory:')
+    d.settrace(True)
+    d.conn.execute('SELECT 1')
+    d.stats.record('SELECT x', 0.5, 2)
+    d.stats.record('SELECT x', 1.5, 3)
+    d.stats.record('SELECT y', 3.0, 1)
+    dump = d.stats.dump()
+    assert dump['executed'] == 1
+    assert dump['queries'] == [
+            {'query': 'SELECT y', 'calls': 1, 'total': 3.0, 'max': 3.0, 'rows': 1},
+            {'query': 'SELECT x', 'calls': 2, 'total': 2.0, 'max': 1.5, 'rows': 5},
+            ]
+    d.stats.reset()
+    assert d.stats.dump() == {'executed': 0, 'queries': []}
+    d.settrace(False)
+    assert d.stats is None
+
+def test_profile(dbfile):
+    d = dbmod.DB(dbfile, profile='fast')
+    assert d.conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+    with d.useprofile('bulk'):
+        assert d.profilename == 'bulk'
+        assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 0
+    assert d.profilename == 'fast'
+    assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 1
+
+def test_profile_deferred(dbfile):
+    """ synchronous can't change mid-transaction, so it waits for the commit. """
+    d = dbmod.DB(dbfile, profile='safe')
+    with d.useprofile('bulk'):
+        d.conn.execute("INSERT INTO sync (whensynced) VALUES (1)")
+        assert d.dirty
+    assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 0
+    d.commit()
+    assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 2
+
+def test_profile_deferred_temp(dbfile):
+    """ leaving a profile with a temp table and an open transaction, like debug fileimport does. """
+    d = dbmod.DB(dbfile, profile='safe')
+    with d.useprofile('bulk'):
+        d.conn.execute('CREATE TEMP TABLE stage (x)')
+        d.conn.execute('INSERT INTO stage (x) VALUES (1)')
+        d.conn.execute("INSERT INTO sync (whensynced) VALUES (1)")
+        assert d.dirty
+    assert d.profilename == 'safe'
+    # Restored on commit.
+    assert d.conn.execute('PRAGMA temp_store').fetchone()[0] == 2
+    d.commit()
+    assert d.conn.execute('PRAGMA temp_store').fetchone()[0] == 0
+    assert d.conn.execute('PRAGMA synchronous').fetchone()[0] == 2
@@ -0,0 +1,81 @@
+""" dbutil.py unit tests """
+
+# Module under test.
+import tickmeoff.dbutil as dbutil
+
+import tickmeoff.db as dbmod
+
+import unittest.mock as mock
+
+import pytest
+
+schema = '''
+CREATE TABLE item (itemid INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, value TEXT);
+'''
+
+@pytest.fixture
+def db():
+    def altschema(self):
+        return schema
+
+    with mock.patch.object(dbmod.DB, '_loadschema', altschema):
+        dobj = dbmod.DB(':memory:')
+    return dobj
+
+def names(db):
+    return [(r['name'], r['value']) for r in dbutil.getall(db, 'SELECT * FROM item ORDER BY itemid')]
+
+def test_insertmany(db):
+    count = dbutil.insertmany(db, 'INSERT INTO item (name, value) VALUES (?, ?)', ((str(i), 'v') for i in range(10)))
+    assert count == 10
+    assert len(names(db)) == 10
+
+def test_insertmany_ids(db):
+    ids = dbutil.insertmany(db, 'INSERT OR IGNORE INTO item (name) VALUES (?)', [('a',), ('b',), ('a',)], ids=True)
+    assert ids == [1, 2, None]
+
+@pytest.fixture(params=[True, False], ids=['returning', 'noreturning'])
+def returning(request):
+    """ upsert with and without RETURNING support. """
+    with mock.patch.object(dbutil, '_returning', request.param):
+        yield request.param
+
+def test_upsert(db, returning):
+    aid = dbutil.upsert(db, 'item', 'name', name='a', value='1')
+    bid = dbutil.upsert(db, 'item', 'name', name='b', value='2')
+    assert dbutil.upsert(db, 'item', 'name', name='a', value='3') == aid
+    assert aid != bid
+    assert names(db) == [('a', '3'), ('b', '2')]
+
+def test_upsert_nothing(db, returning):
+    """ upsert with only conflict columns still returns the existing row id. """
+    aid = dbutil.upsert(db, 'item', 'name', name='a')
+    assert dbutil.upsert(db, 'item', 'name', name='a') == aid
+    assert names(db) == [('a', None)]
+
+def test_chunkedcommit(db):
+    with mock.patch.object(db, 'commit') as commit:
+        with dbutil.ChunkedCommit(db, every=3) as counter:
+            for i in range(7):
+                counter()
+            assert commit.call_count == 2
+        # Final commit on exit.
+        assert commit.call_count == 3
+        assert counter.total == 7
+
+def test_chunkedcommit_error(db):
+    with mock.patch.object(db, 'commit') as commit:
+        with pytest.raises(ValueError):
+            with dbutil.ChunkedCommit(db, every=3) as counter:
+                counter()
+                raise ValueError()
+        assert commit.call_count == 0
+
+def test_iterall(db):
+    dbutil.insertmany(db, 'INSERT INTO item (name) VALUES (?)', ((str(i),) for i in range(10)))
+    it = dbutil.iterall(db, 'SELECT name FROM item WHERE itemid > ? ORDER BY itemid', 2, size=3)
+    assert next(it)['name'] == '2'
+    # Cursor stays open while iterating.
+    assert len(db._cursors) == 1
+    assert [r['name'] for r in it] == [str(i) for i in range(3, 10)]
+    assert len(db._cursors) == 0
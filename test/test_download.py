@@ -0,0 +1,149 @@
+""" Concurrent chart source downloads, against a local http.server stand-in. """
+
+# Module under test.
+import tickmeoff.tickmeoff as tmo
+
+import tickmeoff.chartsource as chartsource
+import tickmeoff.db as dbmod
+
+import gzip
+import hashlib
+import http.server
+import threading
+import time
+import unittest.mock as mock
+
+import pytest
+
+def page(entries):
+    return ''.join('<tr><td class="titleColumn"><a title="{}">{}</a><span>({})</span></td></tr>\n'.format(i, t, y) for t, y, i in entries).encode('utf-8')
+
+charts = {
+    '/top': page([('The Shawshank Redemption', 1994, ''), ('The Godfather', 1972, '')]),
+    '/popular': page([('Dune', 2021, ''), ('The Godfather', 1972, '')]),
+    '/noir': page([('Double Indemnity', 1944, ''), ('The Big Sleep', 1946, '')]),
+    '/empty': b'<html><body>layout changed</body></html>',
+    }
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """ Serves charts, paths take a ?delay=seconds of latency. """
+
+    def do_GET(self):
+        path, _, query = self.path.partition('?')
+        self.server.requests.append((path, dict(self.headers)))
+        if query.startswith('delay='):
+            time.sleep(float(query[6:]))
+        body = charts.get(path)
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    srv = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    srv.daemon_threads = True
+    srv.block_on_close = False
+    srv.requests = []
+    srv.url = 'http://127.0.0.1:{}'.format(srv.server_address[1])
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+@pytest.fixture
+def db():
+    d = dbmod.DB(':memory:')
+    # Don't go anywhere near the real chart.
+    chartsource.setenabled(d, chartsource.getsource(d, 'top')['sourceid'], False)
+    return d
+
+def download(db, **kwargs):
+    with mock.patch.object(tmo.time, 'time', return_value=1000):
+        return [(s['name'], r) for s, r in tmo.downloadall(db, **kwargs)]
+
+def test_downloadall(db, server):
+    chartsource.addsource(db, 'slow', server.url + '/top?delay=0.5')
+    chartsource.addsource(db, 'popular', server.url + '/popular', parser='html')
+    results = download(db)
+    # The fast source is imported first, without waiting on the slow one.
+    assert [name for name, r in results] == ['popular', 'slow']
+    added = {name: [m['title'] for m in r[0]] for name, r in results}
+    assert added == {'popular': ['Dune', 'The Godfather'], 'slow': ['The Shawshank Redemption']}
+    # Synced in the same second, but each sync gets its own time.
+    syncs = list(tmo.gethistory(db))
+    assert [(s['whensynced'], s['sourceid']) for s in syncs] == [
+            (1000, chartsource.getsource(db, 'popular')['sourceid']), (1001, chartsource.getsource(db, 'slow')['sourceid'])]
+    assert [r['title'] for r in tmo.getrankings(db, asat=1001)] == ['The Shawshank Redemption', 'The Godfather']
+
+def test_downloadall_notmodified(db, server):
+    chartsource.addsource(db, 'noir', server.url + '/noir')
+    download(db)
+    server.requests.clear()
+    assert download(db) == [('noir', None)]
+    assert server.requests[0][1]['If-None-Match'] == tmo.gethttpcache(db, server.url + '/noir')['etag']
+    assert len(list(tmo.gethistory(db))) == 1
+
+def test_downloadall_timeout(db, server):
+    """ a source that times out fails on its own. """
+    sourceid = chartsource.addsource(db, 'hung', server.url + '/top?delay=1', timeout=0.2)
+    chartsource.addsource(db, 'noir', server.url + '/noir')
+    chartsource.addsource(db, 'missing', server.url + '/none')
+    results = dict(download(db))
+    assert isinstance(results['hung'], Exception)
+    assert isinstance(results['missing'], Exception)
+    assert [m['title'] for m in results['noir'][0]] == ['Double Indemnity', 'The Big Sleep']
+    assert tmo.getlastsync(db, sourceid=sourceid) is None
+
+def test_downloadall_parseerror(db, server):
+    """ a chart that fails to import isn't remembered as fetched, so it's imported again next time. """
+    chartsource.addsource(db, 'empty', server.url + '/empty')
+    chartsource.addsource(db, 'noir', server.url + '/noir')
+    with db.transaction():
+        results = dict(download(db))
+    assert isinstance(results['empty'], Exception)
+    assert tmo.gethttpcache(db, server.url + '/empty') is None
+    assert tmo.gethttpcache(db, server.url + '/noir') is not None
+    server.requests.clear()
+    with db.transaction():
+        results = dict(download(db))
+    assert isinstance(results['empty'], Exception)
+    assert results['noir'] is None
+    assert 'If-None-Match' not in dict(server.requests)['/empty']
+
+def test_downloadall_rollback(db, server):
+    """ a source that fails part way through its import leaves no partial sync. """
+    sourceid = chartsource.addsource(db, 'noir', server.url + '/noir')
+    def addsync(*args):
+        real(*args)
+        raise ValueError('disk full')
+    real = tmo.addsync
+    with mock.patch.object(tmo, 'addsync', side_effect=addsync), db.transaction():
+        results = dict(download(db))
+    assert isinstance(results['noir'], ValueError)
+    assert tmo.getlastsync(db, sourceid=sourceid) is None
+    assert tmo.gethttpcache(db, server.url + '/noir') is None
+    assert [m['title'] for m in download(db)[0][1][0]] == ['Double Indemnity', 'The Big Sleep']
+
+def test_sources(db):
+    sourceid = chartsource.addsource(db, 'noir', 'http://example.org/noir')
+    assert [s['name'] for s in chartsource.getsources(db, enabled=True)] == ['noir']
+    chartsource.setenabled(db, sourceid, False)
+    assert chartsource.getsources(db, enabled=True) == []
+    assert [s['name'] for s in chartsource.getsources(db)] == ['top', 'noir']
@@ -0,0 +1,114 @@
+""" imdb.py unit tests """
+
+# Module under test.
+import tickmeoff.imdb as imdb
+
+import tickmeoff.tickmeoff as tmo
+
+import gzip
+import io
+import os
+import unittest.mock as mock
+
+import pytest
+
+def row(rank, title, year, info):
+    return '''<tr>
+    <td class="posterColumn"><a href="/title/tt{rank:07}/"><img src="poster.jpg" alt="{title}"/></a></td>
+    <td class="titleColumn">
+      {rank}.
+      <a href="/title/tt{rank:07}/" title="{info}">{title}</a>
+      <span class="secondaryInfo">({year})</span>
+    </td>
+    <td class="ratingColumn imdbRating"><strong>9.2</strong></td>
+  </tr>
+'''.format(rank=rank, title=title, year=year, info=info)
+
+def page(entries):
+    return '<html><head><title>Top 250</title></head><body><table><tbody>\n{}</tbody></table></body></html>\n'.format(
+        ''.join(row(i, *e) for i, e in enumerate(entries, 1)))
+
+chart = [
+    ('The Shawshank Redemption', 1994, 'Frank Darabont (dir.)'),
+    ('Léon', 1994, 'Luc Besson (dir.)'),
+    ('Amélie', 2001, 'Jean-Pierre Jeunet (dir.)'),
+    ]
+
+parsers = pytest.mark.parametrize('parsercls', [imdb.ChartParser, imdb.FastChartParser])
+
+@parsers
+def test_parse(parsercls):
+    parser = parsercls()
+    parser.feed(page(chart))
+    assert list(parser) == chart
+    # Entries are only yielded once.
+    assert list(parser) == []
+
+@parsers
+def test_parse_incremental(parsercls):
+    """ each entry is available as soon as its titleColumn cell closes. """
+    parser = parsercls()
+    text = page(chart)
+    first = text.index('</td>', text.index('titleColumn'))
+    parser.feed(text[:first])
+    assert list(parser) == []
+    parser.feed(text[first:first + 5])
+    assert list(parser) == chart[:1]
+    parser.feed(text[first + 5:])
+    assert list(parser) == chart[1:]
+
+class Reader(io.BytesIO):
+    """ Records how much has been read. """
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.reads.append(len(data))
+        return data
+
+@pytest.mark.parametrize('chunksize', [1, 7, 1 << 16])
+def test_chartiter(chunksize):
+    reader = Reader(page(chart).encode('utf-8'))
+    reader.reads = []
+    with mock.patch.object(tmo, 'chunksize', chunksize):
+        it = tmo.chartiter('chart.html', opener=lambda url: reader)
+        assert next(it) == chart[0]
+        if chunksize < 1000:
+            # Before the whole chart has been read.
+            assert reader.tell() < len(reader.getvalue())
+        assert list(it) == chart[1:]
+    assert max(reader.reads) <= chunksize
+
+def corpus(count):
+    with gzip.open(os.path.join(os.path.dirname(__file__), 'charts', 'chart-{}.html.gz'.format(count)), 'rb') as f:
+        return f.read().decode('utf-8')
+
+def parseall(parsercls, page, chunksize):
+    parser = parsercls()
+    entries = []
+    for i in range(0, len(page), chunksize):
+        parser.feed(page[i:i + chunksize])
+        entries.extend(parser)
+    parser.close()
+    return entries + list(parser)
+
+@pytest.mark.parametrize('count', [250, 1000])
+def test_corpus(count):
+    """ both parsers give identical entries, however the page is chunked. """
+    page = corpus(count)
+    expected = parseall(imdb.ChartParser, page, len(page))
+    assert len(expected) == count
+    for chunksize in [len(page), 4096, 97]:
+        assert parseall(imdb.FastChartParser, page, chunksize) == expected
+
+@parsers
+@pytest.mark.parametrize('cell, entry', [
+    ('<td class=titleColumn><a title=x>A &amp; B</a><span>(2001)</span></td>', ('A & B', 2001, 'x')),
+    ('<td id="t" class="titleColumn" data-x="1"><a href="/">No info</a> <span class="s">(1999)</span></td>', ('No info', 1999, '')),
+    ('<TD CLASS="titleColumn"><A TITLE="Dir &#39;x&#39;">Upper</A><SPAN>(1950)</SPAN></TD>', ('Upper', 1950, "Dir 'x'")),
+    ('<td class="titleColumnX"><a>Other</a><span>(2000)</span></td>', None),
+    ('<td class="titleColumn"><a>No year</a></td>', None),
+    ])
+def test_parse_markup(parsercls, cell, entry):
+    parser = parsercls()
+    parser.feed('<table><tr>{}</tr></table>'.format(cell))
+    assert list(parser) == ([entry] if entry else [])
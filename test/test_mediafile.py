@@ -0,0 +1,307 @@
+""" mediafile.py unit tests """
+
+# Module under test.
+import tickmeoff.mediafile as mediafile
+
+import tickmeoff.db as dbmod
+import tickmeoff.tickmeoff as tmo
+
+import os
+import time
+import unittest.mock as mock
+
+import pytest
+
+chart = [
+    ('The Shawshank Redemption', 1994, ''),
+    ('The Godfather', 1972, ''),
+    ('The Dark Knight', 2008, ''),
+    ('12 Angry Men', 1957, ''),
+    ]
+
+tree = {
+    'a': {
+        'The Shawshank Redemption (1994)': ['The Shawshank Redemption (1994).mkv', 'extras.txt'],
+        'Home Video (2001)': ['Home Video (2001).mp4'],
+        },
+    'b': {
+        'The Godfather (1972)': ['The.Godfather.1972.avi'],
+        },
+    }
+
+def maketree(basedir, tree):
+    for name, sub in tree.items():
+        path = os.path.join(basedir, name)
+        if isinstance(sub, dict):
+            os.makedirs(path, exist_ok=True)
+            maketree(path, sub)
+        else:
+            os.makedirs(path, exist_ok=True)
+            for f in sub:
+                with open(os.path.join(path, f), 'w') as fh:
+                    fh.write(f)
+
+def age(basedir):
+    """ Backdate recently changed directory mtimes, so the scan trusts them. """
+    now = time.time()
+    old = now - 3600 - age.calls
+    age.calls += 1
+    for cwd, dirs, files in os.walk(basedir):
+        if os.stat(cwd).st_mtime > now - 60:
+            os.utime(cwd, (old, old))
+age.calls = 0
+
+@pytest.fixture
+def media(tmpdir):
+    basedir = str(tmpdir.join('media'))
+    maketree(basedir, tree)
+    age(basedir)
+    db = dbmod.DB(':memory:')
+    with mock.patch.object(tmo.time, 'time', return_value=1000):
+        tmo._import(db, chart[:3])
+    mediafile.addlocation(db, basedir)
+    return db, basedir
+
+def test_scan(media):
+    db, basedir = media
+    added, counts = mediafile.scanpaths(db)
+    assert sorted(added) == ['The Shawshank Redemption (1994).mkv', 'The.Godfather.1972.avi']
+    assert counts == {'visited': 6, 'skipped': 0}
+
+def test_rescan_unchanged(media):
+    db, basedir = media
+    mediafile.scanpaths(db)
+    added, counts = mediafile.scanpaths(db)
+    assert added == []
+    assert counts == {'visited': 0, 'skipped': 6}
+
+def test_rescan_changed(media):
+    db, basedir = media
+    mediafile.scanpaths(db)
+    maketree(basedir, {'b': {'The Dark Knight (2008)': ['The Dark Knight (2008).mkv']}})
+    age(basedir)
+    added, counts = mediafile.scanpaths(db)
+    assert added == ['The Dark Knight (2008).mkv']
+    # b and the new directory.
+    assert counts == {'visited': 2, 'skipped': 5}
+
+def test_rescan_removed(media):
+    db, basedir = media
+    mediafile.scanpaths(db)
+    os.rename(os.path.join(basedir, 'a'), os.path.join(basedir, 'c'))
+    age(basedir)
+    added, counts = mediafile.scanpaths(db)
+    # Top dir, c and its two subdirs. b is unchanged. Shawshank is followed to its new directory.
+    assert counts == {'visited': 4, 'skipped': 2, 'moved': 1}
+    assert db.conn.execute("SELECT COUNT(*) FROM dirstate WHERE pathname LIKE ?", (os.path.join(basedir, 'a') + '%',)).fetchone()[0] == 0
+
+def test_rescan_full(media):
+    db, basedir = media
+    mediafile.scanpaths(db)
+    added, counts = mediafile.scanpaths(db, full=True)
+    assert counts == {'visited': 6, 'skipped': 0}
+
+def test_rescan_newmovies(media):
+    """ only the directories of cached misses that now match are listed after new movies are added. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Home Video', 2001, '')])
+    added, counts = mediafile.scanpaths(db)
+    assert added == ['Home Video (2001).mp4']
+    assert counts == {'visited': 1, 'skipped': 5}
+
+def test_rescan_newmovies_nomatch(media):
+    """ new movies that match nothing on disk don't make directories changed. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Casablanca', 1942, '')])
+    added, counts = mediafile.scanpaths(db)
+    assert added == []
+    assert counts == {'visited': 0, 'skipped': 6}
+    # The miss isn't checked again until the catalog grows again.
+    assert keyed(db) == []
+
+@pytest.mark.parametrize('workers', [1, 2, 8])
+def test_scan_workers(media, workers):
+    db, basedir = media
+    added, counts = mediafile.scanpaths(db, workers=workers)
+    assert sorted(added) == ['The Shawshank Redemption (1994).mkv', 'The.Godfather.1972.avi']
+    assert counts == {'visited': 6, 'skipped': 0}
+    added, counts = mediafile.scanpaths(db, workers=workers)
+    assert counts == {'visited': 0, 'skipped': 6}
+
+def test_scan_knownnames(media):
+    """ already known filenames are skipped without a query per file. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    maketree(basedir, {'c': {'Copy': ['The.Godfather.1972.avi', 'The Dark Knight (2008).mkv']}})
+    age(basedir)
+    with mock.patch.object(mediafile, 'getmediafile') as getmediafile:
+        added, counts = mediafile.scanpaths(db)
+    assert getmediafile.call_count == 0
+    assert added == ['The Dark Knight (2008).mkv']
+
+def test_scan_batches(media):
+    """ small batches are committed as they're written. """
+    db, basedir = media
+    with mock.patch.object(db, 'commit') as commit:
+        added, counts = mediafile.scanpaths(db, every=1)
+    assert len(added) == 2
+    # One per directory state, each taking any of its media with it, and the final commit.
+    assert commit.call_count == 7
+
+def test_scan_batches_dirs(tmpdir):
+    """ directory states count towards a commit, even without any media. """
+    basedir = str(tmpdir.join('media'))
+    maketree(basedir, {str(n): ['notes.txt'] for n in range(30)})
+    age(basedir)
+    db = dbmod.DB(':memory:')
+    mediafile.addlocation(db, basedir)
+    with mock.patch.object(db, 'commit') as commit:
+        mediafile.scanpaths(db, every=5)
+    # 31 directories in commits of 5, and the final commit.
+    assert commit.call_count == 7
+
+def keyed(db, **kwargs):
+    """ scanpaths returning the filenames that had to be keyed. """
+    with mock.patch.object(mediafile, 'titlekey', wraps=mediafile.titlekey) as titlekey:
+        mediafile.scanpaths(db, **kwargs)
+    return sorted(c.args[0] for c in titlekey.call_args_list)
+
+def test_matchcache(media):
+    db, basedir = media
+    assert keyed(db) == ['Home Video (2001).mp4', 'The Shawshank Redemption (1994).mkv', 'The.Godfather.1972.avi']
+    rows = db.conn.execute('SELECT filename, movieid FROM matchcache ORDER BY filename').fetchall()
+    assert [(r[0], r[1] is None) for r in rows] == [('Home Video (2001).mp4', True), ('The Shawshank Redemption (1994).mkv', False), ('The.Godfather.1972.avi', False)]
+    # Everything is known, even on a full rescan.
+    assert keyed(db, full=True) == []
+
+def test_matchcache_newmovies(media):
+    """ only cached misses are keyed again after the catalog grows. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Home Video', 2001, '')])
+    assert keyed(db) == ['Home Video (2001).mp4']
+    assert db.conn.execute('SELECT COUNT(*) FROM matchcache WHERE movieid IS NULL').fetchone()[0] == 0
+
+def test_matchcache_moved(media):
+    """ a cached miss is rechecked where it was last seen. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    os.rename(os.path.join(basedir, 'a', 'Home Video (2001)'), os.path.join(basedir, 'b', 'Home Video (2001)'))
+    age(basedir)
+    mediafile.scanpaths(db)
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Home Video', 2001, '')])
+    added, counts = mediafile.scanpaths(db)
+    assert added == ['Home Video (2001).mp4']
+    assert counts['visited'] == 1
+
+def test_matchcache_changed(media):
+    """ a file whose size changes is keyed again. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    with open(os.path.join(basedir, 'b', 'The Godfather (1972)', 'The.Godfather.1972.avi'), 'w') as f:
+        f.write('more')
+    assert keyed(db, full=True) == ['The.Godfather.1972.avi']
+
+def test_scan_locations(media):
+    """ files in the same directory share a location, with its full path stored. """
+    db, basedir = media
+    maketree(basedir, {'a': {'The Shawshank Redemption (1994)': ['The Shawshank Redemption (1994) part2.mkv']}})
+    mediafile.scanpaths(db)
+    rows = db.conn.execute('SELECT pathname, fullpath FROM location WHERE parentid IS NOT NULL ORDER BY pathname').fetchall()
+    assert [tuple(r) for r in rows] == [
+            (os.path.join('a', 'The Shawshank Redemption (1994)'), os.path.join(basedir, 'a', 'The Shawshank Redemption (1994)')),
+            (os.path.join('b', 'The Godfather (1972)'), os.path.join(basedir, 'b', 'The Godfather (1972)')),
+            ]
+
+def test_scan_durations(media):
+    """ new media is probed as it's scanned, older media by probemissing. """
+    db, basedir = media
+    with mock.patch.object(mediafile.probe, 'duration', return_value=5400.0) as duration:
+        mediafile.scanpaths(db)
+    # Only the media files that matched, not the home video or extras.txt.
+    assert duration.call_count == 2
+    rows = db.conn.execute('SELECT filename, size, mtime, duration FROM mediafile ORDER BY filename').fetchall()
+    assert [(r['filename'], r['size'], r['duration']) for r in rows] == [
+            ('The Shawshank Redemption (1994).mkv', 35, 5400.0),
+            ('The.Godfather.1972.avi', 22, 5400.0),
+            ]
+    db.conn.execute('UPDATE mediafile SET size = NULL, mtime = NULL, duration = NULL, fingerprint = NULL')
+    with mock.patch.object(mediafile.probe, 'duration', return_value=60.0):
+        assert mediafile.probemissing(db, workers=2) == 2
+        assert mediafile.probemissing(db, workers=2) == 0
+    assert [r[0] for r in db.conn.execute('SELECT duration FROM mediafile')] == [60.0, 60.0]
+
+def probed(db, **kwargs):
+    """ scanpaths returning the paths that were fingerprinted. """
+    with mock.patch.object(mediafile.probe, 'fingerprint', wraps=mediafile.probe.fingerprint) as fingerprint:
+        mediafile.scanpaths(db, **kwargs)
+    return sorted(os.path.basename(c.args[0]) for c in fingerprint.call_args_list)
+
+def test_scan_probes(media):
+    """ files are probed once when they're added, never if they don't match. """
+    db, basedir = media
+    assert probed(db) == ['The Shawshank Redemption (1994).mkv', 'The.Godfather.1972.avi']
+    assert probed(db, full=True) == []
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Casablanca', 1942, '')])
+    assert probed(db, full=True) == []
+    with mock.patch.object(tmo.time, 'time', return_value=3000):
+        tmo._import(db, [('Home Video', 2001, '')])
+    assert probed(db) == ['Home Video (2001).mp4']
+
+def test_scan_probes_sizes(media):
+    """ unmatched files are only fingerprinted when they could be a known file that moved. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    # Same size as The.Godfather.1972.avi.
+    maketree(basedir, {'c': {'x': ['godfather-1972.avi', 'other.avi']}})
+    with open(os.path.join(basedir, 'c', 'x', 'godfather-1972.avi'), 'w') as f:
+        f.write('The.Godfather.1972.avi')
+    age(basedir)
+    assert probed(db) == ['godfather-1972.avi']
+
+def godfather(basedir, *parts):
+    return os.path.join(basedir, 'b', *parts)
+
+@pytest.mark.parametrize('newname', ['The.Godfather.1972.avi', 'godfather.avi'])
+def test_scan_moved(media, newname):
+    """ moved or renamed files are updated in place, without being matched again. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    before = db.conn.execute("SELECT mediafileid, movieid, fingerprint FROM mediafile WHERE filename = 'The.Godfather.1972.avi'").fetchone()
+    os.makedirs(godfather(basedir, 'Crime'))
+    os.rename(godfather(basedir, 'The Godfather (1972)', 'The.Godfather.1972.avi'), godfather(basedir, 'Crime', newname))
+    age(basedir)
+    with mock.patch.object(mediafile.movie.KeyIndex, 'search') as search:
+        added, counts = mediafile.scanpaths(db)
+    assert search.call_count == 0
+    assert added == []
+    assert counts['moved'] == 1
+    after = db.conn.execute('SELECT mf.*, l.fullpath FROM mediafile mf JOIN location l ON mf.locationid = l.locationid WHERE mediafileid = ?', (before['mediafileid'],)).fetchone()
+    assert (after['filename'], after['movieid'], after['fingerprint']) == (newname, before['movieid'], before['fingerprint'])
+    assert after['fullpath'] == godfather(basedir, 'Crime')
+    assert db.conn.execute('SELECT COUNT(*) FROM mediafile').fetchone()[0] == 2
+
+def test_reconcile(media):
+    db, basedir = media
+    mediafile.scanpaths(db)
+    os.unlink(godfather(basedir, 'The Godfather (1972)', 'The.Godfather.1972.avi'))
+    assert mediafile.reconcile(db, workers=2) == 1
+    assert [r[0] for r in db.conn.execute('SELECT filename FROM mediafile')] == ['The Shawshank Redemption (1994).mkv']
+    # Its subdir location has gone too.
+    assert db.conn.execute("SELECT COUNT(*) FROM location WHERE pathname = ?", (os.path.join('b', 'The Godfather (1972)'),)).fetchone()[0] == 0
+    assert mediafile.reconcile(db) == 0
+
+def test_reconcile_unmounted(media):
+    """ nothing is deleted under a root that has gone. """
+    db, basedir = media
+    mediafile.scanpaths(db)
+    os.rename(basedir, basedir + '.unmounted')
+    assert mediafile.reconcile(db) == 0
+    assert db.conn.execute('SELECT COUNT(*) FROM mediafile').fetchone()[0] == 2
@@ -12,6 +12,9 @@ m.additem(Command(StringArgument(), name='exec2'))
 m.additem(Command(name='exec22'))
 enumargs = Command(EnumArgument(opts=['one', 'two']), name='enumargs')
 m.additem(enumargs)
+# Optional enum followed by an optional enum.
+twoargs = Command(CompositeArgument(EnumArgument(opts=['one', 'two']), NoArgument()), CompositeArgument(EnumArgument(opts=['--x']), NoArgument()), name='twoargs')
+m.additem(twoargs)
 s1 = SubMenu(name='submenu1', rootmenu=m)
 s1.additem(Command(NoArgument(), name='exec3'))
 m.additem(s1)
@@ -77,6 +80,11 @@ def test_getopts(menu, search, expected):
     (m, 'submenu1 exec3', m['submenu1']['exec3'], []),
     (m, 'submenu1 exec3 ', m['submenu1']['exec3'], []),
     (m, 'submenu1  exec3 ', m['submenu1']['exec3'], []),
+    # Several args.
+    (m, 'twoargs', m['twoargs'], []),
+    (m, 'twoargs one', m['twoargs'], ['one']),
+    (m, 'twoargs one --x', m['twoargs'], ['one', '--x']),
+    (m, 'twoargs  two   --x ', m['twoargs'], ['two', '--x']),
     ])
 def test_getcommandargs(menu, search, ecmd, eargs):
     rcmd, rargs = menu.getcommandargs(search)
@@ -107,6 +115,7 @@ def test_getcommandargs(menu, search, ecmd, eargs):
     # exec3 takes no args.
     (m, 'submenu1 exec3 x', ValueError),
     (m, 'submenu1  exec3 x', ValueError),
+    (m, 'twoargs one --y', ValueError),
     ])
 def test_getcommandargs_errors(menu, search, expected):
     with pytest.raises(expected):
@@ -114,7 +123,7 @@ def test_getcommandargs_errors(menu, search, expected):
         print('search "{}" -> cmd, args {}, {}'.format(search, cmd.name, args))
 
 def test_menulist():
-    assert list(m) == ['help', 'exec1', 'exec2', 'exec22', 'enumargs', 'submenu1']
+    assert list(m) == ['help', 'exec1', 'exec2', 'exec22', 'enumargs', 'twoargs', 'submenu1']
 
 def test_commandfuncdefaultname():
     cf = CommandFunc(func=bool)
@@ -234,3 +243,27 @@ def test_compositeargs_parse(clss, search, expected):
     else:
         result = cmparg.parse(search)
         assert result == expected
+
+prefixopts = ['b', 'a b', 'a', 'ab', 'c', 'a']
+
+@pytest.mark.parametrize('search,matches,longmatch,longest', [
+    ('', prefixopts, [], None),
+    ('a', ['a b', 'a', 'ab', 'a'], [('a', ''), ('a', '')], 2),
+    ('a ', ['a b'], [('a', ' '), ('a', ' ')], 2),
+    ('a b', ['a b'], [('a b', ''), ('a', ' b'), ('a', ' b')], 1),
+    ('a bc', [], [('a b', 'c'), ('a', ' bc'), ('a', ' bc')], 1),
+    ('abc', [], [('a', 'bc'), ('ab', 'c'), ('a', 'bc')], 3),
+    ('x', [], [], None),
+    ])
+def test_prefixindex(search, matches, longmatch, longest):
+    index = PrefixIndex(prefixopts)
+    assert index.matches(search) == matches
+    assert index.longmatch(search) == longmatch
+    assert index.longest(search) == longest
+
+def test_enumargs_reindex():
+    """ replacing opts rebuilds the index. """
+    arg = EnumArgument(opts=['one', 'two'])
+    assert arg.getoptions('t') == (['two'], None)
+    arg.opts = ['three']
+    assert arg.getoptions('t') == (['three'], None)
@@ -22,8 +22,7 @@ INSERT INTO second (name, firstid) VALUES ('gday', 1);
 INSERT INTO second (name, firstid) VALUES ('ahoj', 1);
 '''
 
-@pytest.fixture
-def db():
+def makedb():
     """ In-memory sqlite test db. """
     def altschema(self):
         return schema
@@ -32,7 +31,11 @@ def db():
         dobj = dbmod.DB(':memory:')
     return dobj
 
-gdb = db()
+@pytest.fixture
+def db():
+    return makedb()
+
+gdb = makedb()
 
 @pytest.mark.parametrize('db,tablename,columnname,expected', [
     (gdb, 'first', 'name', ['hello', 'world', 'hello world']),
@@ -102,3 +105,18 @@ def test_dbargs_getcommandargs_nonexist(db, search):
     argname = mdb.TableArgument(db, 'first', 'name')
     with pytest.raises(ValueError):
         argname.parse(search)
+
+def test_dbargs_cached(db):
+    """ completions only hit the table when the db has changed. """
+    argname = mdb.TableArgument(db, 'first', 'name')
+    db.settrace(True)
+    argname.getoptions('h')
+    argname.getoptions('he')
+    assert argname.opts == ['hello', 'world', 'hello world']
+    loads = [q for q in db.stats.dump()['queries'] if 'FROM first' in q['query']]
+    assert [q['calls'] for q in loads] == [1]
+    with db as c:
+        c.execute('''INSERT INTO first (name, description) VALUES ('help', 'me')''')
+    assert argname.getoptions('hel') == (['hello', 'hello world', 'help'], None)
+    loads = [q for q in db.stats.dump()['queries'] if 'FROM first' in q['query']]
+    assert [q['calls'] for q in loads] == [2]
@@ -8,7 +8,8 @@ import pytest
 
 import os
 
-import test.mockfs
+# test isn't a package (and would clash with the stdlib one), pytest puts this dir on the path.
+import mockfs as mockfsmod
 
 fsdict = {
     'dir1': {
@@ -22,7 +23,7 @@ fsdict = {
     },
     'dir3': {},
 }
-mockfs = test.mockfs.Filesystem(fsdict, home='/dir2')
+mockfs = mockfsmod.Filesystem(fsdict, home='/dir2')
 
 sep = os.path.sep
 
@@ -130,3 +131,38 @@ def test_menuls_parse(cls, path, expected, remainder):
             opts, rem = arg.parse(path)
             assert opts == expected
             assert rem == remainder
+
+def cachefs():
+    """ Private filesystem, tests must also patch in a private DirCache. """
+    return mockfsmod.Filesystem({'dir1': {'file1': None, 'sub1': {}}}, home='/dir1')
+
+def test_menuls_singlepass():
+    """ a listing is one scandir and no per entry stats. """
+    fs = cachefs()
+    with fs, mock.patch.object(mls, 'dircache', mls.DirCache(ttl=0)):
+        arg = mls.ListArgument()
+        assert arg.getoptions('/dir1/')[0] == ['sub1' + sep, 'file1']
+        assert mls.dirs('/dir1') == ['sub1' + sep]
+        assert mls.files('/dir1') == ['file1']
+    assert fs.calls['scandir'] == 1
+    assert fs.calls['isfile'] == 0
+
+def test_menuls_cacheinvalidate():
+    fs = cachefs()
+    with fs, mock.patch.object(mls, 'dircache', mls.DirCache(ttl=0)):
+        assert mls.files('/dir1') == ['file1']
+        # Changes without an mtime change aren't seen.
+        fs._fsdict['dir1']['file2'] = None
+        assert mls.files('/dir1') == ['file1']
+        fs.touch('/dir1')
+        assert mls.files('/dir1') == ['file1', 'file2']
+    assert fs.calls['scandir'] == 2
+
+def test_menuls_cachettl():
+    """ within the ttl, not even the directory is stat'ed. """
+    fs = cachefs()
+    with fs, mock.patch.object(mls, 'dircache', mls.DirCache(ttl=60)):
+        mls.ls('/dir1')
+        mls.ls('/dir1')
+    assert fs.calls['stat'] == 1
+    assert fs.calls['scandir'] == 1
@@ -0,0 +1,45 @@
+""" movie.py unit tests """
+
+# Module under test.
+import tickmeoff.movie as movie
+
+import tickmeoff.db as dbmod
+
+import pytest
+
+@pytest.mark.parametrize('title,expected', [
+    ('The Shawshank Redemption (1994)', ('redemption shawshank', 1994)),
+    ('The.Godfather.1972', ('godfather', 1972)),
+    ("Schindler's List [1993] 1080p", ('list schindlers', 1993)),
+    ('2001 A Space Odyssey (1968)', ('2001 odyssey space', 1968)),
+    ])
+def test_makekeywithyear(title, expected):
+    assert movie.makekeywithyear(title) == expected
+
+def test_makekeywithyear_noyear():
+    with pytest.raises(ValueError):
+        movie.makekeywithyear('Home Video')
+
+def test_keyindex():
+    db = dbmod.DB(':memory:')
+    gid = movie.addmovie(db, 'The Godfather', 1972, '', 0)
+    index = movie.getkeyindex(db)
+    assert index.search('godfather', 1972) == (gid,)
+    assert index.search('godfather', 1974) == ()
+    # Cached until movies are added.
+    assert movie.getkeyindex(db) is index
+    g2id = movie.addmovie(db, 'The Godfather: Part II', 1974, '', 0)
+    index = movie.getkeyindex(db)
+    assert index.search('godfather ii part', 1974) == (g2id,)
+    assert len(index) == 2
+
+@pytest.mark.parametrize('title', [
+    "Schindler's List",
+    'Dr. Strangelove or: How I Learned to Stop Worrying and Love the Bomb',
+    'The Lord of the Rings - The Return of the King',
+    ' [Rec] (2007) ',
+    'A',
+    '',
+    ])
+def test_makekeytitles(title):
+    assert movie.makekeytitles([title]) == [movie.makekeytitle(title)]
@@ -0,0 +1,130 @@
+""" playlist.py unit tests """
+
+# Module under test.
+import tickmeoff.playlist as playlist
+
+import os
+import unittest.mock as mock
+
+import pytest
+
+@pytest.fixture
+def linkdir(tmpdir):
+    return str(tmpdir.join('links'))
+
+movs = [
+    ('1) The Shawshank Redemption (1994)', '/media/shawshank'),
+    ('2) The Godfather (1972)', '/media/godfather'),
+    ]
+
+def test_makesymlinks(linkdir):
+    changes = playlist.makesymlinks(linkdir, movs)
+    assert changes['created'] == sorted(x[0] for x in movs)
+    assert playlist.readlinks(linkdir) == dict(movs)
+    # Only links are kept in sync, not regular files.
+    assert sorted(os.listdir(linkdir)) == sorted(x[0] for x in movs)
+
+def test_makesymlinks_incremental(linkdir):
+    playlist.makesymlinks(linkdir, movs)
+    open(os.path.join(linkdir, 'notes.txt'), 'w').close()
+    new = [
+        ('1) The Shawshank Redemption (1994)', '/media/shawshank'),
+        ('2) The Godfather (1972)', '/media2/godfather'),
+        ('3) The Dark Knight (2008)', '/media/darkknight'),
+        ]
+    with mock.patch.object(playlist.os, 'symlink', wraps=os.symlink) as symlink, mock.patch.object(playlist.os, 'unlink', wraps=os.unlink) as unlink:
+        changes = playlist.makesymlinks(linkdir, new[1:])
+    assert changes['created'] == ['3) The Dark Knight (2008)']
+    assert changes['retargeted'] == ['2) The Godfather (1972)']
+    assert changes['removed'] == ['1) The Shawshank Redemption (1994)']
+    assert changes['unchanged'] == 0
+    assert symlink.call_count == 2
+    assert unlink.call_count == 1
+    assert playlist.readlinks(linkdir) == dict(new[1:])
+    assert os.path.exists(os.path.join(linkdir, 'notes.txt'))
+    changes = playlist.makesymlinks(linkdir, new[1:])
+    assert changes['unchanged'] == 2
+    assert changes['created'] == changes['retargeted'] == changes['removed'] == []
+
+def test_makesymlinks_dryrun(linkdir):
+    playlist.makesymlinks(linkdir, movs[:1])
+    changes = playlist.makesymlinks(linkdir, movs[1:], dryrun=True)
+    assert changes['created'] == ['2) The Godfather (1972)']
+    assert changes['removed'] == ['1) The Shawshank Redemption (1994)']
+    assert playlist.readlinks(linkdir) == dict(movs[:1])
+    assert playlist.makesymlinks(str(os.path.join(linkdir, 'none')), movs, dryrun=True)['created'] == sorted(x[0] for x in movs)
+    assert not os.path.exists(os.path.join(linkdir, 'none'))
+
+def test_makesymlinks_blocked(linkdir):
+    """ a label taken by a regular file or directory is reported, never replaced. """
+    os.makedirs(os.path.join(linkdir, movs[1][0]))
+    with open(os.path.join(linkdir, movs[0][0]), 'w') as f:
+        f.write('keep me')
+    for dryrun in (True, False):
+        changes = playlist.makesymlinks(linkdir, movs, dryrun=dryrun)
+        assert changes['blocked'] == sorted(x[0] for x in movs)
+        assert changes['created'] == []
+        assert changes['unchanged'] == 0
+    with open(os.path.join(linkdir, movs[0][0])) as f:
+        assert f.read() == 'keep me'
+    assert playlist.readlinks(linkdir) == {}
+
+def test_makesymlinks_blocked_late(linkdir):
+    """ a file that turns up after the check blocks its link too. """
+    real = os.symlink
+    def symlink(target, path):
+        open(path, 'w').close()
+        real(target, path)
+    with mock.patch.object(playlist.os, 'symlink', side_effect=symlink):
+        changes = playlist.makesymlinks(linkdir, movs[:1])
+    assert changes['blocked'] == [movs[0][0]]
+    assert changes['created'] == []
+    assert not os.path.islink(os.path.join(linkdir, movs[0][0]))
+
+def test_writeplaylists(tmpdir):
+    outputs = {fmt: str(tmpdir.join('pl', 'playlist.{}'.format(fmt))) for fmt in playlist.formats}
+    movs = [('1: Amélie(2001) - ', str(tmpdir.join('media', 'amelie.mkv'))), ('2: Tom & Jerry(1940) - ', str(tmpdir.join('media', 'tj.mkv')))]
+    written = playlist.writeplaylists(outputs, iter(movs))
+    assert written == {f: True for f in outputs.values()}
+    assert open(outputs['m3u'], encoding='utf-8').read() == '#EXTM3U\n\n#EXTINF:-1,1: Amélie(2001) - \n../media/amelie.mkv\n\n#EXTINF:-1,2: Tom & Jerry(1940) - \n../media/tj.mkv\n\n'
+    pls = open(outputs['pls'], encoding='utf-8').read().splitlines()
+    assert pls[0] == '[playlist]'
+    assert 'File2={}'.format(movs[1][1]) in pls
+    assert pls[-2:] == ['NumberOfEntries=2', 'Version=2']
+    xspf = open(outputs['xspf'], encoding='utf-8').read()
+    assert '<title>2: Tom &amp; Jerry(1940) - </title>' in xspf
+    assert '<location>file://{}</location>'.format(movs[0][1].replace('é', '%C3%A9')) in xspf
+    # Only the temporary files are cleaned up.
+    assert sorted(os.listdir(str(tmpdir.join('pl')))) == sorted(os.path.basename(f) for f in outputs.values())
+
+def test_writeplaylists_unchanged(tmpdir):
+    filename = str(tmpdir.join('playlist.m3u'))
+    assert playlist.writem3u(filename, movs) == {filename: True}
+    mtime = os.stat(filename).st_mtime_ns
+    os.utime(filename, ns=(mtime - 10**9, mtime - 10**9))
+    assert playlist.writem3u(filename, movs) == {filename: False}
+    assert os.stat(filename).st_mtime_ns == mtime - 10**9
+    assert playlist.writem3u(filename, movs[:1]) == {filename: True}
+    assert os.listdir(str(tmpdir)) == ['playlist.m3u']
+
+def test_writeplaylists_error(tmpdir):
+    """ a failed write leaves the old playlist alone. """
+    filename = str(tmpdir.join('playlist.m3u'))
+    playlist.writem3u(filename, movs)
+    before = open(filename).read()
+    def failing():
+        yield movs[0]
+        raise RuntimeError('db went away')
+    with pytest.raises(RuntimeError):
+        playlist.writem3u(filename, failing())
+    assert open(filename).read() == before
+    assert os.listdir(str(tmpdir)) == ['playlist.m3u']
+
+def test_writeplaylists_durations(tmpdir):
+    outputs = {fmt: str(tmpdir.join('playlist.{}'.format(fmt))) for fmt in playlist.formats}
+    playlist.writeplaylists(outputs, [('A', '/media/a.mkv', 5399.6), ('B', '/media/b.mpg', None)])
+    m3u = open(outputs['m3u']).read().splitlines()
+    assert [x for x in m3u if x.startswith('#EXTINF')] == ['#EXTINF:5400,A', '#EXTINF:-1,B']
+    pls = open(outputs['pls']).read().splitlines()
+    assert 'Length1=5400' in pls and 'Length2=-1' in pls
+    assert open(outputs['xspf']).read().count('<duration>5399600</duration>') == 1
@@ -0,0 +1,94 @@
+""" probe.py unit tests """
+
+# Module under test.
+import tickmeoff.probe as probe
+
+import os
+import struct
+import unittest.mock as mock
+
+import pytest
+
+# Big enough that reading the media data would show up.
+padding = 1 << 24
+
+def ebml(eid, data, size=None):
+    """ EBML element with an 8 byte size, or an unknown size. """
+    if size is None:
+        size = (1 << 56) | len(data)
+    return eid.to_bytes((eid.bit_length() + 7) // 8, 'big') + size.to_bytes(8, 'big') + data
+
+def mkv(f, duration, fmt='>d', scale=1000000):
+    f.write(ebml(probe.EBML, ebml(0x4282, b'matroska')))
+    info = ebml(probe.TIMECODESCALE, scale.to_bytes(3, 'big')) + ebml(probe.DURATION, struct.pack(fmt, duration * 1e9 / scale))
+    # Unknown sized segment, as written by streaming muxers.
+    f.write(ebml(probe.SEGMENT, b'', size=0x01FFFFFFFFFFFFFF))
+    f.write(ebml(0x114D9B74, b'\x00' * 64))
+    f.write(ebml(probe.INFO, info))
+    f.write(ebml(probe.CLUSTER, b''))
+    f.truncate(padding)
+
+def box(kind, data):
+    return struct.pack('>I4s', 8 + len(data), kind) + data
+
+def mp4(f, duration, version=0):
+    f.write(box(b'ftyp', b'isom\x00\x00\x02\x00'))
+    # mdat before moov, with a 64 bit size.
+    f.write(struct.pack('>I4sQ', 1, b'mdat', 16 + padding))
+    f.seek(padding, os.SEEK_CUR)
+    if version == 1:
+        mvhd = struct.pack('>B3xQQIQ', 1, 0, 0, 600, int(duration * 600))
+    else:
+        mvhd = struct.pack('>B3xIIII', 0, 0, 0, 600, int(duration * 600))
+    f.write(box(b'moov', box(b'mvhd', mvhd + b'\x00' * 80)))
+
+def chunk(fourcc, data):
+    return struct.pack('<4sI', fourcc, len(data)) + data + b'\x00' * (len(data) & 1)
+
+def avi(f, duration, odml=False):
+    usecs = 40000
+    frames = int(duration * 1e6 / usecs)
+    avih = struct.pack('<5I', usecs, 0, 0, 0, frames // 2 if odml else frames) + b'\x00' * 36
+    hdrl = b'hdrl' + chunk(b'avih', avih) + chunk(b'LIST', b'strl' + chunk(b'strh', b'\x00' * 55))
+    if odml:
+        hdrl += chunk(b'LIST', b'odml' + chunk(b'dmlh', struct.pack('<I', frames) + b'\x00' * 244))
+    f.write(b'RIFF' + struct.pack('<I', padding) + b'AVI ' + chunk(b'LIST', hdrl))
+    f.truncate(padding)
+
+@pytest.mark.parametrize('name, writer, kwargs', [
+    ('a.mkv', mkv, {}),
+    ('b.webm', mkv, {'fmt': '>f', 'scale': 1000}),
+    ('c.mp4', mp4, {}),
+    ('d.m4v', mp4, {'version': 1}),
+    ('e.avi', avi, {}),
+    ('f.avi', avi, {'odml': True}),
+    ])
+def test_duration(tmpdir, name, writer, kwargs):
+    path = str(tmpdir.join(name))
+    with open(path, 'wb') as f:
+        writer(f, 5400, **kwargs)
+    with mock.patch.object(probe.os, 'pread', wraps=os.pread) as pread:
+        assert probe.duration(path) == pytest.approx(5400, abs=0.01)
+    # Headers only.
+    assert sum(c.args[1] for c in pread.call_args_list) < 4096
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'\x00' * 1024,
+    b'MPEG program stream',
+    probe.EBML.to_bytes(4, 'big') + b'\x80',
+    b'RIFF\x00\x00\x00\x00AVI LIST',
+    b'\x00\x00\x00\x08ftyp\x00\x00\x00\x00moov',
+    # Unknown sized element inside Info.
+    ebml(probe.EBML, b'') + ebml(probe.SEGMENT, b'', size=0x01FFFFFFFFFFFFFF) + ebml(probe.INFO, ebml(probe.DURATION, b'\x00' * 8, size=0x01FFFFFFFFFFFFFF)),
+    # Info bigger than the file.
+    ebml(probe.EBML, b'') + ebml(probe.SEGMENT, b'', size=0x01FFFFFFFFFFFFFF) + ebml(probe.INFO, b'', size=(1 << 56) | 100),
+    ])
+def test_duration_unknown(tmpdir, data):
+    path = str(tmpdir.join('x.mkv'))
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert probe.duration(path) is None
+
+def test_duration_missing(tmpdir):
+    assert probe.duration(str(tmpdir.join('none.mkv'))) is None
@@ -0,0 +1,72 @@
+""" report.py unit tests """
+
+# Module under test.
+import tickmeoff.report as report
+
+import tickmeoff.chartsource as chartsource
+import tickmeoff.db as dbmod
+import tickmeoff.mediafile as mediafile
+import tickmeoff.tickmeoff as tmo
+
+import unittest.mock as mock
+
+import pytest
+
+chart = [
+    ('The Shawshank Redemption', 1994, ''),
+    ('The Godfather', 1972, ''),
+    ('The Dark Knight', 2008, ''),
+    ]
+
+@pytest.fixture
+def db():
+    d = dbmod.DB(':memory:')
+    with mock.patch.object(tmo.time, 'time', return_value=1000):
+        tmo._import(d, chart)
+    root = mediafile.addlocation(d, '~/media/')
+    sub = mediafile.addlocation(d, 'godfather', baselocid=root)
+    movies = {m['title']: m['movieid'] for m in tmo.getrankings(d)}
+    mediafile.addmediafile(d, 'godfather.mkv', sub, movies['The Godfather'])
+    mediafile.addmediafile(d, 'godfather2.mkv', sub, movies['The Godfather'])
+    mediafile.addmediafile(d, 'shawshank.mkv', root, movies['The Shawshank Redemption'])
+    return d
+
+def test_ranked(db):
+    assert [(r['indexnum'], r['path']) for r in report.ranked(db)] == [
+            (1, '~/media/shawshank.mkv'),
+            (2, '~/media/godfather/godfather.mkv'),
+            (3, None),
+            ]
+
+def test_rankedpaths(db):
+    assert [(r['indexnum'], r['title'], r['path']) for r in report.rankedpaths(db)] == [
+            (1, 'The Shawshank Redemption', '~/media/shawshank.mkv'),
+            (2, 'The Godfather', '~/media/godfather/godfather.mkv'),
+            ]
+
+def test_missing(db):
+    assert [(r['indexnum'], r['title']) for r in report.missing(db)] == [(3, 'The Dark Knight')]
+
+def test_asat(db):
+    """ reports default to the latest chart. """
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, chart[1:])
+    assert [r['title'] for r in report.missing(db)] == ['The Dark Knight']
+    assert [r['indexnum'] for r in report.missing(db, asat=2000)] == [2]
+    assert [r['indexnum'] for r in report.missing(db, asat=1000)] == [3]
+
+def test_sources(db):
+    """ reports are of the top chart unless another source is asked for. """
+    popular = chartsource.addsource(db, 'popular', 'http://example.org/popular')
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        tmo._import(db, [('Dune', 2021, ''), ('The Godfather', 1972, '')], sourceid=popular)
+    assert [r['title'] for r in report.ranked(db)] == [t for t, y, i in chart]
+    assert [r['title'] for r in report.missing(db)] == ['The Dark Knight']
+    assert [r['title'] for r in report.missing(db, sourceid=popular)] == ['Dune']
+    assert [(r['indexnum'], r['title']) for r in report.rankedpaths(db, sourceid=popular)] == [(2, 'The Godfather')]
+
+@pytest.mark.parametrize('func', [report.ranked, report.rankedpaths, report.missing])
+def test_onequery(db, func):
+    db.settrace(True)
+    list(func(db))
+    assert [q['calls'] for q in db.stats.dump()['queries']] == [1]
@@ -0,0 +1,165 @@
+""" tickmeoff.py unit tests """
+
+# Module under test.
+import tickmeoff.tickmeoff as tmo
+
+import tickmeoff.chartsource as chartsource
+import tickmeoff.db as dbmod
+import tickmeoff.movie as movie
+
+import email.message
+import gzip
+import io
+import unittest.mock as mock
+import urllib.error
+import zlib
+
+import pytest
+
+chart1 = [
+    ('The Shawshank Redemption', 1994, 'Frank Darabont (dir.)'),
+    ('The Godfather', 1972, 'Francis Ford Coppola (dir.)'),
+    ('The Dark Knight', 2008, 'Christopher Nolan (dir.)'),
+    ]
+
+chart2 = [
+    ('The Godfather', 1972, 'Francis Ford Coppola (dir.)'),
+    ('12 Angry Men', 1957, 'Sidney Lumet (dir.)'),
+    ('The Shawshank Redemption', 1994, 'Frank Darabont (dir.)'),
+    ]
+
+@pytest.fixture
+def db():
+    return dbmod.DB(':memory:')
+
+def importat(db, entries, now, sourceid=None):
+    with mock.patch.object(tmo.time, 'time', return_value=now):
+        return tmo._import(db, entries, sourceid=sourceid)
+
+def test_import_empty(db):
+    with pytest.raises(Exception):
+        tmo._import(db, [])
+
+def test_import_iter(db):
+    """ entries can come straight from the streaming chart parser. """
+    added, ranks = importat(db, iter(chart1), 1000)
+    assert len(added) == len(ranks) == 3
+    with pytest.raises(Exception):
+        importat(db, iter([]), 2000)
+    assert tmo.getlastsync(db)['whensynced'] == 1000
+
+def test_import(db):
+    added, ranks = importat(db, chart1, 1000)
+    assert [(m['title'], m['yearmade'], m['notes'], m['indexnum']) for m in added] == [(t, y, i, n) for n, (t, y, i) in enumerate(chart1, 1)]
+    assert len(ranks) == 3
+    assert [(r['indexnum'], r['title']) for r in tmo.getrankings(db)] == [(1, 'The Shawshank Redemption'), (2, 'The Godfather'), (3, 'The Dark Knight')]
+    mov = movie.getmovie(db, 'The Godfather', 1972)
+    assert mov['mkey'] == movie.makekeytitle('The Godfather')
+    assert mov['whenadded'] == 1000
+
+def test_import_existing(db):
+    importat(db, chart1, 1000)
+    added, ranks = importat(db, chart2, 2000)
+    # Only the unseen movie is added, and it keeps its chart position.
+    assert [(m['title'], m['indexnum']) for m in added] == [('12 Angry Men', 2)]
+    assert len(ranks) == 3
+    assert len(list(movie.getmovies(db))) == 4
+    assert [r['title'] for r in tmo.getrankings(db)] == [t for t, y, i in chart2]
+    assert [r['title'] for r in tmo.getrankings(db, asat=1000)] == [t for t, y, i in chart1]
+
+def titles(movs):
+    return [m[0] if isinstance(m, tuple) else m['title'] for m in movs]
+
+def test_sources(db):
+    """ rankings, punted and diffs are of one chart source, the top chart by default. """
+    popular = chartsource.addsource(db, 'popular', 'http://example.org/popular')
+    importat(db, chart1, 1000)
+    importat(db, chart2, 2000, sourceid=popular)
+    importat(db, chart1[1:] + chart1[:1], 3000)
+    assert tmo.getlastsync(db)['whensynced'] == 3000
+    assert titles(tmo.getrankings(db)) == titles(chart1[1:] + chart1[:1])
+    assert titles(tmo.getrankings(db, sourceid=popular)) == titles(chart2)
+    # The popular chart's movies weren't dropped from the top chart.
+    assert tmo.getpunted(db) == []
+    assert [(m['title'], m['diff']) for m in tmo.getdiffs(db)] == [('The Godfather', 1), ('The Dark Knight', 1), ('The Shawshank Redemption', -2)]
+    # Only one popular chart so far.
+    assert tmo.getpunted(db, sourceid=popular) == []
+    assert list(tmo.getdiffs(db, sourceid=popular)) == []
+    importat(db, chart2[:1], 4000, sourceid=popular)
+    assert titles(tmo.getpunted(db, sourceid=popular)) == ['12 Angry Men', 'The Shawshank Redemption']
+    assert titles(tmo.getrankings(db)) == titles(chart1[1:] + chart1[:1])
+
+def test_import_duplicate_entry(db):
+    """ a movie listed twice in a chart is only added once. """
+    added, ranks = importat(db, chart1 + chart1[:1], 1000)
+    assert len(added) == 3
+    assert len(ranks) == 4
+    assert len(list(movie.getmovies(db))) == 3
+
+def test_import_unchanged(db):
+    """ the same chart again doesn't add another sync. """
+    importat(db, chart1, 1000)
+    assert importat(db, iter(chart1), 2000) is None
+    assert [s['whensynced'] for s in tmo.gethistory(db)] == [1000]
+    assert importat(db, chart2, 3000) is not None
+    assert importat(db, chart1, 4000) is not None
+    assert [s['whensynced'] for s in tmo.gethistory(db)] == [1000, 3000, 4000]
+
+def page(entries):
+    return ''.join('<td class="titleColumn"><a title="{}">{}</a><span>({})</span></td>\n'.format(i, t, y) for t, y, i in entries).encode('utf-8')
+
+class Server:
+    """ Fake opener serving body, with 304s for matching validators. """
+
+    def __init__(self, body, encoding=None, etag='"v1"', lastmodified='Sat, 01 Jan 2000 00:00:00 GMT'):
+        self.body = body
+        self.encoding = encoding
+        self.etag = etag
+        self.lastmodified = lastmodified
+        self.requests = []
+
+    def __call__(self, url, headers={}, timeout=None):
+        self.requests.append(headers)
+        if headers.get('If-None-Match') == self.etag:
+            raise urllib.error.HTTPError(url, 304, 'Not Modified', email.message.Message(), None)
+        body = self.body
+        resp = io.BytesIO({None: lambda b: b, 'gzip': gzip.compress, 'deflate': zlib.compress,
+            'rawdeflate': lambda b: zlib.compress(b, wbits=-zlib.MAX_WBITS)}[self.encoding](body))
+        resp.headers = email.message.Message()
+        resp.headers['ETag'] = self.etag
+        resp.headers['Last-Modified'] = self.lastmodified
+        if self.encoding:
+            resp.headers['Content-Encoding'] = 'deflate' if self.encoding == 'rawdeflate' else self.encoding
+        return resp
+
+def download(db, opener):
+    """ downloadall of just the test chart source, returns its result. """
+    [(source, result)] = tmo.downloadall(db, sources=[chartsource.getsource(db, 'test')], workers=1, opener=opener)
+    return result
+
+@pytest.mark.parametrize('encoding', [None, 'gzip', 'deflate', 'rawdeflate'])
+def test_download(db, encoding, monkeypatch):
+    monkeypatch.setattr(tmo, 'chunksize', 16)
+    chartsource.addsource(db, 'test', 'http://charts/top')
+    server = Server(page(chart1), encoding=encoding)
+    with mock.patch.object(tmo.time, 'time', return_value=1000):
+        added, ranks = download(db, server)
+    assert [(m['title'], m['yearmade'], m['notes']) for m in added] == chart1
+    assert server.requests[0] == {'Accept-Encoding': 'gzip, deflate'}
+    # Conditional the next time around, and nothing to import.
+    assert download(db, server) is None
+    assert server.requests[1]['If-None-Match'] == '"v1"'
+    assert server.requests[1]['If-Modified-Since'] == 'Sat, 01 Jan 2000 00:00:00 GMT'
+    # A new version of the same chart is still deduplicated.
+    server.etag = '"v2"'
+    with mock.patch.object(tmo.time, 'time', return_value=2000):
+        assert download(db, server) is None
+    assert tmo.gethttpcache(db, 'http://charts/top')['etag'] == '"v2"'
+    assert len(list(tmo.gethistory(db))) == 1
+
+def test_download_error(db):
+    def opener(url, headers={}, timeout=None):
+        raise urllib.error.HTTPError(url, 500, 'Server Error', email.message.Message(), None)
+    chartsource.addsource(db, 'test', 'http://charts/top')
+    assert isinstance(download(db, opener), urllib.error.HTTPError)
+    assert tmo.gethttpcache(db, 'http://charts/top') is None
@@ -0,0 +1,67 @@
+"""
+Bulk movie catalog loading from a title dataset.
+Copyright (c) 2018 Acke, see LICENSE file for allowable usage.
+
+The dataset is a gzipped tab separated file with a header row, as published by IMDb (title.basics.tsv.gz).
+It's streamed a chunk of rows at a time, so memory use doesn't grow with its size.
+"""
+
+import csv
+import gzip
+import itertools
+import time
+
+from . import dbutil
+from . import movie
+
+# Rows staged and committed at a time.
+chunksize = 50000
+
+# Dataset columns used, and the value it uses for nulls.
+titlecol = 'primaryTitle'
+yearcol = 'startYear'
+typecol = 'titleType'
+null = '\\N'
+
+def readtitles(filename, types=('movie',)):
+    """ yield (title, year) for the dataset rows of the given title types, rows without a year are skipped. """
+    # QUOTE_NONE as titles may contain unbalanced quotes.
+    with gzip.open(filename, 'rt', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        header = next(reader)
+        title, year, kind = header.index(titlecol), header.index(yearcol), header.index(typecol)
+        for row in reader:
+            if row[kind] in types and row[year] != null:
+                yield row[title], int(row[year])
+
+def _stage(db, titles):
+    """ Stage a chunk of (title, year), returns the number of rows staged. """
+    keys = movie.makekeytitles(title for title, year in titles)
+    return dbutil.insertmany(db, 'INSERT INTO catalogstage (title, yearmade, mkey) VALUES (?, ?, ?)',
+            ((title, year, key) for (title, year), key in zip(titles, keys)))
+
+def loadtitles(db, filename, types=('movie',), progress=None):
+    """ Add the dataset's movies that aren't already in the catalog.
+    progress is called with (titles read, movies added) after each chunk. Returns (titles read, movies added). """
+    dbutil.insert(db, 'CREATE TEMP TABLE IF NOT EXISTS catalogstage (title TEXT NOT NULL, yearmade INTEGER, mkey TEXT NOT NULL)')
+    dbutil.insert(db, 'DELETE FROM catalogstage')
+    now = int(time.time())
+    read = added = 0
+    titles = readtitles(filename, types=types)
+    with dbutil.ChunkedCommit(db, every=chunksize) as commit:
+        while True:
+            chunk = list(itertools.islice(titles, chunksize))
+            if not chunk:
+                break
+            read += _stage(db, chunk)
+            # A title may be in the dataset more than once, only the first is added.
+            dbutil.insert(db, '''INSERT INTO movie (title, yearmade, notes, whenadded, mkey)
+                    SELECT s.title, s.yearmade, NULL, ?, s.mkey FROM catalogstage s
+                    WHERE NOT EXISTS (SELECT 1 FROM movie m WHERE m.title = s.title AND m.yearmade = s.yearmade)
+                    GROUP BY s.title, s.yearmade ORDER BY MIN(s.rowid)''', now)
+            added += dbutil.getone(db, 'SELECT changes()')[0]
+            dbutil.insert(db, 'DELETE FROM catalogstage')
+            commit(len(chunk))
+            if progress is not None:
+                progress(read, added)
+    return read, added
@@ -0,0 +1,27 @@
+""" Registry of the charts to download. """
+
+from . import dbutil
+
+# Reports are of this chart unless another source is given.
+defaultsource = 'top'
+
+def addsource(db, name, url, parser='fast', timeout=30.0):
+    return dbutil.insert(db, 'INSERT INTO chartsource (name, url, parser, timeout) VALUES (?, ?, ?, ?)', name, url, parser, timeout)
+
+def getsource(db, name):
+    return dbutil.getone(db, 'SELECT * FROM chartsource WHERE name = ?', name)
+
+def resolve(db, sourceid=None):
+    """ sourceid, or the default source's id when it's None. """
+    if sourceid is not None:
+        return sourceid
+    row = getsource(db, defaultsource)
+    return row['sourceid'] if row else None
+
+def getsources(db, enabled=None):
+    if enabled is None:
+        return dbutil.getall(db, 'SELECT * FROM chartsource ORDER BY sourceid')
+    return dbutil.getall(db, 'SELECT * FROM chartsource WHERE enabled = ? ORDER BY sourceid', int(enabled))
+
+def setenabled(db, sourceid, enabled):
+    dbutil.insert(db, 'UPDATE chartsource SET enabled = ? WHERE sourceid = ?', int(enabled), sourceid)
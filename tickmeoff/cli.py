@@ -8,5 +8,10 @@ def main():
     defaultdb = os.path.join(os.path.expanduser('~'), ".tickmeoff.db")
     parser = argparse.ArgumentParser()
     parser.add_argument('db', nargs='?', default=defaultdb, help="path of database file to use. Default: %(default)s")
+    parser.add_argument('--profile', choices=sorted(db.profiles), default='safe', help="sqlite performance profile. Default: %(default)s")
+    parser.add_argument('--stats', action='store_true', help="collect query stats from startup, see 'debug stats'")
     args = parser.parse_args()
-    shell.run(db=db.DB(args.db))
+    d = db.DB(args.db, profile=args.profile)
+    if args.stats:
+        d.settrace(True)
+    shell.run(db=d)
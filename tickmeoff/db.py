@@ -2,35 +2,130 @@
 Mini database connection wrapper
 Copyright (c) 2018 Acke, see LICENSE file for allowable usage.
 """
+import contextlib
 import os
+import random
 import sqlite3
+import time
+import urllib.parse
+
+# Named sqlite performance profiles.
+# safe: durable, the default.
+# fast: interactive use, may lose the last commits on power loss but won't corrupt the db.
+# bulk: large imports/scans, trades durability for speed while running.
+profiles = {
+    'safe': {'journal_mode': 'WAL', 'synchronous': 'FULL', 'cache_size': -2000, 'mmap_size': 0, 'temp_store': 'DEFAULT'},
+    'fast': {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 268435456, 'temp_store': 'MEMORY'},
+    'bulk': {'journal_mode': 'WAL', 'synchronous': 'OFF', 'cache_size': -262144, 'mmap_size': 1073741824, 'temp_store': 'MEMORY'},
+    }
+
+# Pragmas that sqlite refuses to change inside a transaction (temp_store once a temp table exists).
+txpragmas = {'journal_mode', 'synchronous', 'temp_store'}
+
+# Seconds to wait on another process's lock before giving up.
+busytimeout = 10.0
+# Attempts at starting a write transaction before giving up.
+beginretries = 5
+
+class QueryStats:
+    """ Per query call counts, latencies and row counts. """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.queries = {}
+        # Count of every statement sqlite itself executes, including those that bypass dbutil.
+        self.executed = 0
+
+    def trace(self, statement):
+        """ sqlite3 trace callback. """
+        self.executed += 1
+
+    def record(self, query, elapsed, rows):
+        try:
+            q = self.queries[query]
+        except KeyError:
+            q = self.queries[query] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'rows': 0}
+        q['calls'] += 1
+        q['total'] += elapsed
+        q['max'] = max(q['max'], elapsed)
+        q['rows'] += rows
+
+    def dump(self):
+        """ Return stats as a dict, slowest queries first. """
+        queries = [dict(query=' '.join(k.split()), **v) for k, v in self.queries.items()]
+        return {'executed': self.executed, 'queries': sorted(queries, key=lambda q: q['total'], reverse=True)}
 
 class DB:
 
-    def __init__(self, dbfile):
+    def __init__(self, dbfile, profile='safe', timeout=busytimeout, readonly=False):
         self.filename = dbfile
+        self.timeout = timeout
+        self.readonly = readonly
         self._cursors = []
-        if dbfile == ':memory:' or not os.path.exists(dbfile):
+        self._deferred = {}
+        self.stats = None
+        if readonly:
+            self._connect()
+        elif dbfile == ':memory:' or not os.path.exists(dbfile):
             self._createandloaddb()
         else:
             self._loaddb()
+        self.setprofile(profile)
 
-    def _loaddb(self):
-        self.conn = sqlite3.connect(self.filename)
+    def _connect(self):
+        if self.readonly:
+            self.conn = sqlite3.connect('file:{}?mode=ro'.format(urllib.parse.quote(os.path.abspath(self.filename))), timeout=self.timeout, uri=True)
+        else:
+            # sqlite's busy handler retries with backoff until the timeout is up.
+            self.conn = sqlite3.connect(self.filename, timeout=self.timeout)
         self.conn.execute('PRAGMA foreign_keys=ON')
         self.conn.row_factory = sqlite3.Row
 
+    def _loaddb(self):
+        self._connect()
+        self._migrate()
+
     def _loadschema(self):
         schemafile = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'schema.sqlite')
         return open(schemafile).read()
 
+    def _loadmigrations(self):
+        """ Return the list of (version, script) schema migrations in version order. """
+        migdir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'migrations')
+        migrations = []
+        for f in os.listdir(migdir):
+            # Migration files are named NNNN-description.sqlite
+            num, ext = os.path.splitext(f)
+            if ext == '.sqlite':
+                migrations.append((int(num.split('-')[0]), open(os.path.join(migdir, f)).read()))
+        return sorted(migrations)
+
+    @property
+    def version(self):
+        return self.conn.execute('PRAGMA user_version').fetchone()[0]
+
+    def _migrate(self):
+        """ Bring an existing db up to the latest schema version. """
+        for num, script in self._loadmigrations():
+            if num > self.version:
+                # Run each migration and its version bump as a single transaction.
+                try:
+                    self.conn.executescript('BEGIN IMMEDIATE;\n{}\nPRAGMA user_version = {};\nCOMMIT;'.format(script, num))
+                except sqlite3.Error:
+                    self.rollback()
+                    # Another process may have beaten us to it.
+                    if self.version < num:
+                        raise
+
     def _createandloaddb(self):
         """ Create the db: load in the schema and populate with default config. """
         basedir = os.path.dirname(self.filename)
         # basedir will return '' if self.filename is in the current directory.
         if basedir != '':
             os.makedirs(basedir, exist_ok=True)
-        self._loaddb()
+        self._connect()
         with self as conn:
             conn.executescript(self._loadschema())
             self.commit()
@@ -46,9 +141,115 @@ class DB:
 
     def commit(self):
         self.conn.commit()
+        self._applydeferred()
 
     def rollback(self):
         self.conn.rollback()
+        self._applydeferred()
+
+    def setprofile(self, name):
+        """ Apply a named performance profile. Settings that can't be changed inside a transaction
+        are deferred until the next commit/rollback. """
+        self.profilename = name
+        self._deferred = {}
+        for pragma, value in profiles[name].items():
+            if pragma == 'journal_mode' and self.readonly:
+                # Leave it to the writers.
+                pass
+            elif pragma in txpragmas and self.dirty:
+                self._deferred[pragma] = value
+            else:
+                self.conn.execute('PRAGMA {} = {}'.format(pragma, value))
+
+    def _applydeferred(self):
+        deferred, self._deferred = self._deferred, {}
+        for pragma, value in deferred.items():
+            self.conn.execute('PRAGMA {} = {}'.format(pragma, value))
+
+    @contextlib.contextmanager
+    def useprofile(self, name):
+        """ Temporarily switch to another performance profile. """
+        old = self.profilename
+        self.setprofile(name)
+        try:
+            yield self
+        finally:
+            self.setprofile(old)
+
+    def settrace(self, enabled=True):
+        """ Turn query stats collection on/off. """
+        if enabled:
+            if self.stats is None:
+                self.stats = QueryStats()
+            self.conn.set_trace_callback(self.stats.trace)
+        else:
+            self.stats = None
+            self.conn.set_trace_callback(None)
+
+    def _begin(self):
+        """ Start a write transaction, backing off and retrying if the db stays locked past the busy timeout. """
+        delay = 0.1
+        for attempt in range(beginretries):
+            try:
+                self.conn.execute('BEGIN IMMEDIATE')
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) or attempt == beginretries - 1:
+                    raise
+                time.sleep(delay * random.uniform(1, 2))
+                delay *= 2
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ Short write transaction, committed on success and rolled back on error.
+        Joins the current transaction if there's one already open. """
+        if self.dirty:
+            yield self
+        else:
+            self._begin()
+            try:
+                yield self
+            except BaseException:
+                self.rollback()
+                raise
+            self.commit()
+
+    @contextlib.contextmanager
+    def savepoint(self, name='nested'):
+        """ Nested transaction, its changes are undone on error without touching the rest of the
+        current transaction. A write transaction is started if there isn't one open. """
+        with self.transaction():
+            self.conn.execute('SAVEPOINT {}'.format(name))
+            try:
+                yield self
+            except BaseException:
+                self.conn.execute('ROLLBACK TO SAVEPOINT {}'.format(name))
+                self.conn.execute('RELEASE SAVEPOINT {}'.format(name))
+                raise
+            self.conn.execute('RELEASE SAVEPOINT {}'.format(name))
+
+    @contextlib.contextmanager
+    def snapshot(self):
+        """ Read-only connection with a consistent view of the db, for reports.
+        Uncommitted changes are only visible on this connection, so use it while dirty. """
+        if self.filename == ':memory:' or self.dirty:
+            yield self
+        else:
+            snap = DB(self.filename, profile=self.profilename, timeout=self.timeout, readonly=True)
+            if self.stats is not None:
+                snap.stats = self.stats
+                snap.conn.set_trace_callback(self.stats.trace)
+            try:
+                snap.conn.execute('BEGIN')
+                yield snap
+            finally:
+                snap.conn.close()
+
+    @property
+    def dataversion(self):
+        """ Changes whenever the db content may have changed, by this or any other connection. """
+        # data_version only tracks other connections, total_changes covers our own.
+        return self.conn.execute('PRAGMA data_version').fetchone()[0], self.conn.total_changes
 
     @property
     def dirty(self):
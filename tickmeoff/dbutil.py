@@ -1,17 +1,54 @@
 """ Simple case db utility functions. """
 
+import sqlite3
+import time
+
+# Rows fetched per round trip by iterall.
+batchsize = 500
+
+# upsert needs sqlite 3.24, RETURNING is used when it's there (3.35).
+_returning = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+def _record(db, query, elapsed, rows):
+    """ Add query timing to db stats, if they're being collected. """
+    if db.stats is not None:
+        db.stats.record(query, elapsed, rows)
+
 def getone(db, query, *values):
+    start = time.perf_counter()
     with db as cur:
         res = cur.execute(query, values)
         row = res.fetchone()
+    _record(db, query, time.perf_counter() - start, 0 if row is None else 1)
     return row
 
 def getall(db, query, *values):
+    start = time.perf_counter()
     with db as cur:
         res = cur.execute(query, values)
         rows = res.fetchall()
+    _record(db, query, time.perf_counter() - start, len(rows))
     return rows
 
+def iterall(db, query, *values, size=None):
+    """ Generator version of getall. Rows are fetched in batches of size, and the cursor is kept on the
+    db cursor stack until iteration is finished. """
+    count = 0
+    # Only time spent in sqlite is counted, not time spent by the caller between batches.
+    elapsed = 0.0
+    with db as cur:
+        start = time.perf_counter()
+        res = cur.execute(query, values)
+        while True:
+            rows = res.fetchmany(size or batchsize)
+            elapsed += time.perf_counter() - start
+            if not rows:
+                break
+            count += len(rows)
+            yield from rows
+            start = time.perf_counter()
+    _record(db, query, elapsed, count)
+
 def getlast(db, table):
     return getone(db, 'SELECT * from {t} ORDER BY {t}id DESC LIMIT 1'.format(t=table))
 
@@ -29,6 +66,7 @@ def wherelike(**kwargs):
     return where, value
 
 def insert(db, query, *values):
+    start = time.perf_counter()
     with db as cur:
         res = cur.execute(query, values)
         if res.rowcount == 0:
@@ -36,4 +74,67 @@ def insert(db, query, *values):
             newid = None
         else:
             newid = res.lastrowid
+        rowcount = res.rowcount
+    _record(db, query, time.perf_counter() - start, max(rowcount, 0))
     return newid
+
+def insertmany(db, query, rows, ids=False):
+    """ Insert a batch of rows on a single cursor.
+    Returns the list of new row ids if ids is True, otherwise the number of rows inserted. """
+    start = time.perf_counter()
+    with db as cur:
+        if ids:
+            newids = []
+            for values in rows:
+                res = cur.execute(query, values)
+                newids.append(None if res.rowcount == 0 else res.lastrowid)
+            ret = newids
+            rowcount = sum(1 for x in newids if x is not None)
+        else:
+            ret = rowcount = cur.executemany(query, rows).rowcount
+    _record(db, query, time.perf_counter() - start, max(rowcount, 0))
+    return ret
+
+def upsert(db, table, conflict, **values):
+    """ Insert a row, or update the existing row that clashes on the conflict column(s).
+    Returns the rowid of the inserted/updated row. """
+    if isinstance(conflict, str):
+        conflict = (conflict,)
+    cols = list(values.keys())
+    updates = ', '.join('{c} = excluded.{c}'.format(c=c) for c in cols if c not in conflict)
+    query = 'INSERT INTO {t} ({cols}) VALUES ({params}) ON CONFLICT ({conflict}) DO {action}'.format(
+            t=table, cols=', '.join(cols), params=', '.join('?' * len(cols)), conflict=', '.join(conflict),
+            action='UPDATE SET ' + updates if updates else 'NOTHING')
+    if _returning:
+        row = getone(db, query + ' RETURNING rowid', *values.values())
+    else:
+        insert(db, query, *values.values())
+        row = None
+    if row is None:
+        # DO NOTHING doesn't return the existing row, and lastrowid isn't set by an update.
+        row = getone(db, 'SELECT rowid FROM {t} WHERE {where}'.format(t=table, where=' AND '.join('{} = ?'.format(c) for c in conflict)), *(values[c] for c in conflict))
+    return row[0]
+
+class ChunkedCommit:
+    """ Context manager that commits after every n rows, and once more on a clean exit.
+    Call the returned object with the number of rows written since the last call. """
+
+    def __init__(self, db, every=1000):
+        self.db = db
+        self.every = every
+        self.pending = 0
+        self.total = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.db.commit()
+
+    def __call__(self, count=1):
+        self.pending += count
+        self.total += count
+        if self.pending >= self.every:
+            self.db.commit()
+            self.pending = 0
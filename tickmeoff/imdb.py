@@ -1,50 +1,127 @@
+import collections
+import html
 import html.parser as hp
+import re
 
 class ChartParser(hp.HTMLParser):
+    """ Parses (title, year, info) chart entries. The parser can be fed a chunk at a time, iterating
+    yields the entries completed so far. """
 
     def __init__(self):
         super().__init__()
         self._inmovie = False
         self._tags = []
-        self._movies = []
-
-    def _hasattrval(self, attrs, key, value):
-        d = dict(attrs)
-        try:
-            ret = d[key] == value
-        except KeyError:
-            ret = False
-        return ret
+        self._movies = collections.deque()
 
     def handle_starttag(self, tag, attrs):
         # Movie entries begin with <td class="titleColumn">
-        self._tags.append(tag)
         if self._inmovie is False:
-            # Search for new movie entry.
-            if tag == 'td' and self._hasattrval(attrs, 'class', 'titleColumn'):
+            # Search for new movie entry. Markup outside of entries isn't tracked at all.
+            if tag == 'td' and ('class', 'titleColumn') in attrs:
                 self._inmovie = True
-        if self._inmovie and tag == 'a':
-            d = dict(attrs)
-            try:
-                self._info = d['title']
-            except KeyError:
+                self._tags = []
+                self._moviename = None
+                self._year = None
                 self._info = ''
+            else:
+                return
+        self._tags.append(tag)
+        if tag in ('a', 'span'):
+            # Text may arrive in pieces when fed in chunks, so it's collected until the tag closes.
+            self._text = []
+        if tag == 'a':
+            self._info = ''
+            for key, value in attrs:
+                if key == 'title':
+                    self._info = value
 
     def handle_endtag(self, tag):
-        if self._inmovie and tag == 'td':
+        if self._inmovie is False:
+            return
+        if tag == 'a':
+            # Movie name.
+            self._moviename = ''.join(self._text).strip()
+        elif tag == 'span':
+            # Movie year in format (\d{4})
+            self._year = int(''.join(self._text).strip(' ()'))
+        elif tag == 'td':
             self._inmovie = False
-        self._tags.pop()
+            # The entry is complete once its titleColumn cell closes.
+            if self._moviename is not None and self._year is not None:
+                self._movies.append((self._moviename, self._year, self._info))
+        if self._tags:
+            self._tags.pop()
 
     def handle_data(self, data):
-        if self._inmovie:
-            tag = self._tags[-1]
-            if tag == 'a':
-                # Movie name.
-                self._moviename = data.strip()
-            elif tag == 'span':
-                # Movie year in format (\d{4})
-                self._movies.append((self._moviename, int(data.strip(' ()')), self._info))
+        if self._inmovie and self._tags and self._tags[-1] in ('a', 'span'):
+            self._text.append(data)
             #print("-{:8} {}".format(self._tags[-1], data.strip()))
 
     def __iter__(self):
-        return iter(self._movies)
+        """ yield, and forget, the entries parsed so far. """
+        while self._movies:
+            yield self._movies.popleft()
+
+class FastChartParser:
+    """ Same entries and interface as ChartParser, but it only looks for the titleColumn cells and
+    regex matches each one as a whole rather than handling every tag in the page. """
+
+    _cellstart = re.compile(r'''<td\s[^>]*?\bclass\s*=\s*(["']?)(?-i:titleColumn)\1(?:\s[^>]*)?>''', re.IGNORECASE)
+    _cellend = re.compile(r'</td\s*>', re.IGNORECASE)
+    _link = re.compile(r'<a\b([^>]*)>(.*?)</a\s*>', re.IGNORECASE | re.DOTALL)
+    _title = re.compile(r'''\btitle\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))''', re.IGNORECASE)
+    _span = re.compile(r'<span\b[^>]*>(.*?)</span\s*>', re.IGNORECASE | re.DOTALL)
+    _tag = re.compile(r'<[^>]*>')
+    # Enough of the tail to hold a partial cell start tag between feeds.
+    _keep = 256
+
+    def __init__(self):
+        self._buf = ''
+        self._movies = collections.deque()
+
+    def feed(self, data):
+        buf = self._buf + data
+        pos = 0
+        while True:
+            start = self._cellstart.search(buf, pos)
+            if start is None:
+                # Skip ahead, only keeping what may be the start of a cell.
+                self._buf = buf[max(pos, len(buf) - self._keep):]
+                return
+            end = self._cellend.search(buf, start.end())
+            if end is None:
+                # Wait for the rest of the cell.
+                self._buf = buf[start.start():]
+                return
+            self._parsecell(buf[start.end():end.start()])
+            pos = end.end()
+
+    def _parsecell(self, cell):
+        name = year = None
+        info = ''
+        for link in self._link.finditer(cell):
+            title = self._title.search(link.group(1))
+            info = html.unescape(next(x for x in title.groups() if x is not None)) if title else ''
+            name = html.unescape(self._tag.sub('', link.group(2))).strip()
+        # The last span, like the last link, wins.
+        span = None
+        for span in self._span.finditer(cell):
+            pass
+        if span is not None:
+            year = int(html.unescape(self._tag.sub('', span.group(1))).strip(' ()'))
+        if name is not None and year is not None:
+            self._movies.append((name, year, info))
+
+    def close(self):
+        self._buf = ''
+
+    def __iter__(self):
+        """ yield, and forget, the entries parsed so far. """
+        while self._movies:
+            yield self._movies.popleft()
+
+# Parsers by chart source parser name.
+parsers = {
+    'fast': FastChartParser,
+    'html': ChartParser,
+    }
@@ -1,14 +1,31 @@
 """ Of filesystems and media contained therein. """
+import collections
+import concurrent.futures
 import os
 import sys
+import time
 
+from . import config
 from . import dbutil
 from . import movie
+from . import probe
 
 extensions = {'.avi', '.m4v', '.mkv', '.mp4', '.mpg'}
 
+def joinpath(parent, path):
+    """ Materialised location path of path under parent. """
+    return os.path.join(parent, path) if path else parent
+
 def addlocation(db, path, baselocid=None):
-    return dbutil.insert(db, 'INSERT INTO location (pathname, parentid) VALUES (?, ?)', path, baselocid)
+    if baselocid is None:
+        fullpath = path
+    else:
+        fullpath = joinpath(getpathr(db, baselocid), path)
+    return dbutil.insert(db, 'INSERT INTO location (pathname, parentid, fullpath) VALUES (?, ?, ?)', path, baselocid, fullpath)
+
+def addsublocation(db, path, base):
+    """ Return the locationid for path under the base location row, adding it if it's new. """
+    return dbutil.upsert(db, 'location', ('parentid', 'pathname'), pathname=path, parentid=base['locationid'], fullpath=joinpath(base['fullpath'], path))
 
 def deletelocation(db, locationid):
     dbutil.insert(db, 'DELETE FROM location WHERE locationid = ?', locationid)
@@ -17,15 +34,9 @@ def getlocation(db, path):
     return dbutil.getone(db, 'SELECT * FROM location WHERE pathname = ?', path)
 
 def getpathr(db, locationid):
-    parts = []
-    while locationid is not None:
-        loc = dbutil.getone(db, 'SELECT * FROM location WHERE locationid = ?', locationid)
-        if loc:
-            parts.append(loc['pathname'])
-            locationid = loc['parentid']
-        else:
-            locationid = None
-    return os.path.join(*sorted(parts, reverse=True))
+    """ Full path of a location, including its parents. """
+    loc = dbutil.getone(db, 'SELECT fullpath FROM location WHERE locationid = ?', locationid)
+    return loc['fullpath'] if loc else None
 
 def getpaths(db):
     """ Root media paths. """
@@ -39,16 +50,144 @@ def fileiter(filename):
 def mediaiter(sysiter):
     yield from ((dirpart, filename) for dirpart, filename in sysiter if os.path.splitext(filename)[1] in extensions)
 
-def scanfiles(filename):
+def scanfiles(db, filename):
     yield from scan(db=db, iterobj=fileiter(filename))
 
-def pathiter(path):
-    for cwd, dirs, files in os.walk(path):
-        for f in files:
-    	    yield cwd, f
+def setdirstate(db, path, parentid, st, catalog):
+    # A change within the same mtime tick as our listing would go unnoticed, so don't trust very recent mtimes.
+    if time.time() - st.st_mtime < 1:
+        mtime = 0
+    else:
+        mtime = st.st_mtime_ns
+    return dbutil.upsert(db, 'dirstate', 'pathname', pathname=path, parentid=parentid, mtime=mtime, inode=st.st_ino, device=st.st_dev, catalog=catalog)
+
+def deletedirstate(db, dirstateid):
+    # Subdirectory states are removed by cascade.
+    dbutil.insert(db, 'DELETE FROM dirstate WHERE dirstateid = ?', dirstateid)
+
+def titlekey(filename):
+    """ (key, year) for a media filename, or None if it doesn't look like a movie title. """
+    title, ext = os.path.splitext(filename)
+    try:
+        return movie.makekeywithyear(title)
+    except ValueError:
+        return None
+
+def getmatchcache(db):
+    """ {(filename, size, mtime): (movieid, catalog, dirpath)} for previously matched files. """
+    return {(r[0], r[1], r[2]): (r[3], r[4], r[5]) for r in dbutil.iterall(db, 'SELECT filename, size, mtime, movieid, catalog, dirpath FROM matchcache')}
+
+def setmatchcache(db, rows):
+    """ Batch add/update of (filename, size, mtime, movieid, catalog, dirpath) rows. """
+    return dbutil.insertmany(db, 'INSERT OR REPLACE INTO matchcache (filename, size, mtime, movieid, catalog, dirpath) VALUES (?, ?, ?, ?, ?, ?)', rows)
 
-def scanpath(db, path):
-    yield from scan(db=db, iterobj=pathiter(path))
+def recheckmisses(db, index, matches):
+    """ Match the cached misses against movies added since they missed, updating matches and the cache.
+    No directories are listed. Returns the directories of files that now match. """
+    dirs = set()
+    rows = []
+    for filename, size, mtime, dirpath in dbutil.iterall(db, 'SELECT filename, size, mtime, dirpath FROM matchcache WHERE movieid IS NULL AND catalog < ?', index.version):
+        key = titlekey(filename)
+        movieids = index.search(*key) if key else ()
+        movieid = movieids[0] if movieids else None
+        matches[(filename, size, mtime)] = (movieid, index.version, dirpath)
+        rows.append((filename, size, mtime, movieid, index.version, dirpath))
+        if movieid is not None:
+            dirs.add(dirpath)
+    setmatchcache(db, rows)
+    return dirs
+
+def checkdir(path, state, children, full, matches, index, known, sizes):
+    """ Scan worker: stat and, if it has changed (or full), list a directory.
+    Returns (stat, subdirs, media), or media is None if the directory is unchanged in which case subdirs
+    are the known children. stat is None if the directory has gone.
+    media is [((filename, size, mtime), cached match, movieid, duration, fingerprint)]. Files in the match cache
+    aren't keyed again, the rest are matched against the key index here. Files that aren't known media are
+    only probed and fingerprinted if they match a movie, or are the same size as known media (and so may have
+    been moved), so files that will never be added aren't read. """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None, [], None
+    if not full and state and state['mtime'] == st.st_mtime_ns and state['inode'] == st.st_ino and state['device'] == st.st_dev:
+        return st, children, None
+    subdirs = []
+    media = []
+    with os.scandir(path) as it:
+        for entry in it:
+            # Same as os.walk, don't follow symlinked directories.
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif os.path.splitext(entry.name)[1] in extensions and entry.is_file():
+                fst = entry.stat()
+                stamp = (entry.name, fst.st_size, fst.st_mtime_ns)
+                cached = matches.get(stamp)
+                if cached is not None:
+                    movieid = cached[0]
+                else:
+                    key = titlekey(entry.name)
+                    movieids = index.search(*key) if key else ()
+                    movieid = movieids[0] if movieids else None
+                if stamp not in known and (movieid is not None or fst.st_size in sizes):
+                    media.append((stamp, cached, movieid, probe.duration(entry.path), probe.fingerprint(entry.path)))
+                else:
+                    media.append((stamp, cached, movieid, None, None))
+    return st, subdirs, media
+
+def walkpaths(db, roots, full=False, workers=1, counts=None, matches=None, recheck=(), index=None, known=None, sizes=(), written=None):
+    """ yield (root, dirpath, media) for each directory under the roots that has changed since the last scan,
+    and for the recheck directories. Directories are checked (see checkdir) in parallel by a pool of workers,
+    while db access stays on the calling thread. Unchanged directories aren't listed, their known subdirectories
+    are checked instead. known is {(filename, size, mtime): row} of known media, sizes their sizes.
+    written is called with the number of dirstate rows written after each write. """
+    if counts is None:
+        counts = collections.Counter()
+    if matches is None:
+        matches = {}
+    if index is None:
+        index = movie.getkeyindex(db)
+    if known is None:
+        known = {}
+    if written is None:
+        written = lambda count: None
+    catalog = movie.catalogversion(db)
+    states = {r['pathname']: r for r in dbutil.getall(db, 'SELECT * FROM dirstate')}
+    children = collections.defaultdict(list)
+    for r in states.values():
+        children[r['parentid']].append(r['pathname'])
+    pending = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        def submit(path, parentid, root):
+            state = states.get(path)
+            pending[pool.submit(checkdir, path, state, children[state['dirstateid']] if state else [], full or path in recheck,
+                matches, index, known, sizes)] = (path, parentid, root, state)
+        for root in roots:
+            submit(root, None, root)
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in done:
+                path, parentid, root, state = pending.pop(f)
+                st, subdirs, media = f.result()
+                if st is None:
+                    # Directory has gone.
+                    if state:
+                        deletedirstate(db, state['dirstateid'])
+                        written(1)
+                    continue
+                if media is None:
+                    counts['skipped'] += 1
+                    dirstateid = state['dirstateid']
+                else:
+                    counts['visited'] += 1
+                    yield root, path, media
+                    # Only record the directory once its files have been dealt with.
+                    dirstateid = setdirstate(db, path, parentid, st, catalog)
+                    gone = [x for x in children[dirstateid] if x not in subdirs] if state else []
+                    for x in gone:
+                        deletedirstate(db, states[x]['dirstateid'])
+                    written(1 + len(gone))
+                for x in subdirs:
+                    submit(x, dirstateid, root)
 
 def scan(db, iterobj):
     keys = {}
@@ -64,8 +203,26 @@ def removebase(fulldir, basedir):
         endstr = fulldir
     return endstr
 
-def addmediafile(db, filename, locationid, movieid):
-    return dbutil.insert(db, 'INSERT INTO mediafile (filename, locationid, movieid) VALUES (?, ?, ?)', filename, locationid, movieid)
+def addmediafile(db, filename, locationid, movieid, size=None, mtime=None, duration=None, fingerprint=None):
+    return dbutil.insert(db, 'INSERT INTO mediafile (filename, locationid, movieid, size, mtime, duration, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)', filename, locationid, movieid, size, mtime, duration, fingerprint)
+
+def addmediafiles(db, rows):
+    """ Batch add of (filename, locationid, movieid, size, mtime, duration, fingerprint) rows. """
+    return dbutil.insertmany(db, 'INSERT INTO mediafile (filename, locationid, movieid, size, mtime, duration, fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+
+def movemediafile(db, mediafileid, filename, locationid, size, mtime):
+    dbutil.insert(db, 'UPDATE mediafile SET filename = ?, locationid = ?, size = ?, mtime = ? WHERE mediafileid = ?', filename, locationid, size, mtime, mediafileid)
+
+def getknownmedia(db):
+    """ Returns ({fingerprint: row}, {(filename, size, mtime): row}) of media files, rows include their full path. """
+    byfingerprint = {}
+    bystamp = {}
+    for r in dbutil.iterall(db, 'SELECT mf.*, l.fullpath FROM mediafile mf JOIN location l ON mf.locationid = l.locationid'):
+        r = dict(r, path=os.path.expanduser(os.path.join(r['fullpath'], r['filename'])))
+        if r['fingerprint'] is not None:
+            byfingerprint[r['fingerprint']] = r
+        bystamp[(r['filename'], r['size'], r['mtime'])] = r
+    return byfingerprint, bystamp
 
 def getmediafile(db, movieid=None, filename=None):
     if movieid is not None:
@@ -73,18 +230,114 @@ def getmediafile(db, movieid=None, filename=None):
     elif filename is not None:
         return dbutil.getone(db, 'SELECT * FROM mediafile WHERE filename = ?', filename)
 
-def scanpaths(db):
+def scanpaths(db, full=False, workers=None, every=500):
+    """ Scan root paths for new media. Returns (added filenames, counts of directories visited/skipped and files moved). """
+    if workers is None:
+        workers = int(config.getconfig(db, 'scanworkers')['value'])
+    roots = {os.path.expanduser(r['pathname']): r for r in getpaths(db)}
     added = []
-    for rootpath in getpaths(db):
-        basedir = os.path.expanduser(rootpath['pathname'])
-        for mov, fname, fdir in scanpath(db, basedir):
-            mf = getmediafile(db, filename=fname)
-            if mf is None:
-                # Add a subdir.
-                subdir = removebase(fdir, basedir=basedir)
-                locationid = addlocation(db, subdir, baselocid=rootpath['locationid'])
-                # Add the mediafile entry.
-                mf = addmediafile(db, fname, locationid, mov['movieid'])
-                added.append(fname)
-    return added
+    counts = collections.Counter(visited=0, skipped=0)
+    # New mediafile rows are written in batches, commits only happen when a batch is written so
+    # that a directory's state is never committed without its media. Every other write counts
+    # towards a commit too, so a long scan doesn't hold the write lock throughout.
+    batch = []
+    cacherows = []
+    writes = 0
+    locations = {}
+    # Match against the catalog in memory rather than a query per file.
+    index = movie.getkeyindex(db)
+    catalog = index.version
+    matches = getmatchcache(db)
+    # Files that missed before may match movies added since, only their directories need listing again.
+    recheck = recheckmisses(db, index, matches)
+    # To spot files that have been moved or renamed.
+    byfingerprint, bystamp = getknownmedia(db)
+    # A filename is only added once, whichever directory it's in.
+    names = {r['filename'] for r in bystamp.values()}
+    # Files can only have moved from a known file of the same size.
+    sizes = {r['size'] for r in byfingerprint.values()}
+    def location(fdir, root):
+        # One location row per subdir, shared by all of its files.
+        nonlocal writes
+        if fdir not in locations:
+            locations[fdir] = addsublocation(db, removebase(fdir, basedir=root), roots[root])
+            writes += 1
+        return locations[fdir]
+    def written(count):
+        # Called after each directory's state is written, by then its media are all in the batch.
+        nonlocal batch, cacherows, writes
+        writes += count
+        if writes + len(batch) + len(cacherows) >= every:
+            setmatchcache(db, cacherows)
+            commit(addmediafiles(db, batch) + len(cacherows) + writes)
+            batch = []
+            cacherows = []
+            writes = 0
+    with dbutil.ChunkedCommit(db, every=every) as commit:
+        for root, fdir, media in walkpaths(db, roots, full=full, workers=workers, counts=counts, matches=matches, recheck=recheck,
+                index=index, known=bystamp, sizes=sizes, written=written):
+            for stamp, cached, movieid, duration, fingerprint in media:
+                fname = stamp[0]
+                path = os.path.join(fdir, fname)
+                # Unchanged files are known by their stamp, new or renamed files by their content.
+                known = byfingerprint.get(fingerprint) if fingerprint else bystamp.get(stamp)
+                if known is not None and known['path'] != path and not os.path.exists(known['path']):
+                    # Moved, so update it in place rather than adding it again.
+                    movemediafile(db, known['mediafileid'], fname, location(fdir, root), stamp[1], stamp[2])
+                    writes += 1
+                    known['path'] = path
+                    if cached is None or cached[2] != fdir:
+                        cacherows.append(stamp + (known['movieid'], catalog, fdir))
+                    counts['moved'] += 1
+                    continue
+                if cached is None:
+                    # Misses are remembered too, stamped with the catalog they missed.
+                    cacherows.append(stamp + (movieid, catalog, fdir))
+                elif cached[2] != fdir:
+                    # Keep track of where it is, for rechecking misses.
+                    cacherows.append(stamp + cached[:2] + (fdir,))
+                if movieid is not None and fname not in names:
+                    batch.append((fname, location(fdir, root), movieid) + stamp[1:] + (duration, fingerprint))
+                    added.append(fname)
+                    names.add(fname)
+        setmatchcache(db, cacherows)
+        addmediafiles(db, batch)
+    return added, counts
+
+def probestamp(path):
+    """ Returns (size, mtime, duration, fingerprint) of a media file, or None if it can't be found. """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns, probe.duration(path), probe.fingerprint(path)
+
+def probemissing(db, workers=None):
+    """ Probe media files that were added without a size/mtime/duration/fingerprint. Returns the number probed. """
+    if workers is None:
+        workers = int(config.getconfig(db, 'scanworkers')['value'])
+    rows = dbutil.getall(db, 'SELECT mf.mediafileid, l.fullpath, mf.filename FROM mediafile mf JOIN location l ON mf.locationid = l.locationid WHERE mf.size IS NULL OR (mf.fingerprint IS NULL AND mf.size > 0)')
+    paths = [os.path.expanduser(os.path.join(r['fullpath'], r['filename'])) for r in rows]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        stamps = list(pool.map(probestamp, paths))
+    updates = [stamp + (r['mediafileid'],) for r, stamp in zip(rows, stamps) if stamp is not None]
+    dbutil.insertmany(db, 'UPDATE mediafile SET size = ?, mtime = ?, duration = ?, fingerprint = ? WHERE mediafileid = ?', updates)
+    return len(updates)
 
+def reconcile(db, workers=None):
+    """ Delete media files that no longer exist, along with any subdir locations left empty.
+    Files under a root path that has gone are kept, it may just not be mounted. Returns the number of files deleted. """
+    if workers is None:
+        workers = int(config.getconfig(db, 'scanworkers')['value'])
+    rows = dbutil.getall(db, '''SELECT mf.mediafileid, l.fullpath, mf.filename, r.pathname AS root FROM mediafile mf
+            JOIN location l ON mf.locationid = l.locationid
+            JOIN location r ON r.locationid = IFNULL(l.parentid, l.locationid)''')
+    mounted = {root: os.path.isdir(os.path.expanduser(root)) for root in {r['root'] for r in rows}}
+    rows = [r for r in rows if mounted[r['root']]]
+    paths = [os.path.expanduser(os.path.join(r['fullpath'], r['filename'])) for r in rows]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        exists = list(pool.map(os.path.exists, paths))
+    gone = [(r['mediafileid'],) for r, e in zip(rows, exists) if not e]
+    dbutil.insertmany(db, 'DELETE FROM mediafile WHERE mediafileid = ?', gone)
+    dbutil.insert(db, 'DELETE FROM location WHERE parentid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM mediafile WHERE locationid = location.locationid)')
+    return len(gone)
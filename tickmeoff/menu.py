@@ -1,3 +1,5 @@
+import bisect
+
 class Command:
 
     def __init__(self, *args, name='default'):
@@ -22,6 +24,9 @@ class Command:
         for a in self.args:
             arg, s = a.parse(s)
             args.extend(arg)
+            if s is not None:
+                # Arguments are whitespace separated.
+                s = s.lstrip()
         # TODO assert s is None?
         #assert s is None
         return self, args
@@ -111,12 +116,71 @@ class StringArgument:
             ret = [string], None
         return ret
 
+class PrefixIndex:
+    """ Sorted index over a list of options for fast prefix matching.
+    Matches are always returned in the original option order. """
+
+    # Sorts after any other character, used to find the end of a prefix range.
+    maxchar = chr(0x10ffff)
+
+    def __init__(self, opts):
+        self.opts = opts
+        # Stable sort, so equal options keep their original order.
+        self._order = sorted(range(len(opts)), key=opts.__getitem__)
+        self._sorted = [opts[i] for i in self._order]
+
+    def startswith(self, string):
+        """ Positions of options that start with string. """
+        if string == '':
+            return list(range(len(self.opts)))
+        lo = bisect.bisect_left(self._sorted, string)
+        hi = bisect.bisect_left(self._sorted, string + self.maxchar, lo)
+        return sorted(self._order[lo:hi])
+
+    def prefixes(self, string):
+        """ Positions of options that string starts with. """
+        positions = []
+        for l in range(len(string) + 1):
+            prefix = string[:l]
+            i = bisect.bisect_left(self._sorted, prefix)
+            while i < len(self._sorted) and self._sorted[i] == prefix:
+                positions.append(self._order[i])
+                i += 1
+        return sorted(positions)
+
+    def matches(self, string):
+        """ Options that start with string. """
+        return [self.opts[i] for i in self.startswith(string)]
+
+    def longmatch(self, string):
+        """ (option, remainder) for all options that string starts with. """
+        return [(self.opts[i], string[len(self.opts[i]):]) for i in self.prefixes(string)]
+
+    def longest(self, string):
+        """ Position of the longest option that string starts with, or None. """
+        # Shortest prefixes are checked first, so the last hit is the longest.
+        longest = None
+        for l in range(len(string) + 1):
+            i = bisect.bisect_left(self._sorted, string[:l])
+            if i < len(self._sorted) and self._sorted[i] == string[:l]:
+                longest = self._order[i]
+        return longest
+
 class EnumArgument:
 
     def __init__(self, name='enum', opts=None):
         self.name = name
+        self._index = None
         self.opts = [] if opts is None else opts
 
+    @property
+    def index(self):
+        """ PrefixIndex over opts, rebuilt whenever opts is replaced. """
+        opts = self.opts
+        if self._index is None or self._index.opts is not opts or len(self._index._sorted) != len(opts):
+            self._index = PrefixIndex(opts)
+        return self._index
+
     def parse(self, string):
         if string is not None:
             # Looking for an exact match. We'll assume string is equal or greater than opts.
@@ -132,7 +196,7 @@ class EnumArgument:
         raise ValueError()
 
     def longmatch(self, string):
-        return [(opt, string[len(opt):]) for opt in self.opts if string.startswith(opt)]
+        return self.index.longmatch(string)
 
     def getoptions(self, string):
         # string can either be:
@@ -143,21 +207,20 @@ class EnumArgument:
         ## Remainders really complicate things.
         # First, find the longest exact match.
         # eg, string 'a ', opts = ['a', 'a b']
-        opts = self.opts
+        index = self.index
         # Search for partial matches.
-        retopts = [x for x in opts if x.startswith(string)]
+        retopts = index.matches(string)
         remainder = None
         if len(retopts) == 0:
             # Search for exact match and remainder.
-            reversedopts = list(sorted(opts, reverse=True))
-            for x in reversedopts:
-                if string.startswith(x):
-                    # We have an exact match and a remainder.
-                    retopts = [x]
-                    remainder = string[len(x):]
-                    if remainder == '':
-                        remainder = None
-                    break
+            i = index.longest(string)
+            if i is not None:
+                # We have an exact match and a remainder.
+                x = index.opts[i]
+                retopts = [x]
+                remainder = string[len(x):]
+                if remainder == '':
+                    remainder = None
         return retopts, remainder
 
 class RootMenu:
@@ -166,6 +229,8 @@ class RootMenu:
     def __init__(self, name):
         self.name = name
         self.commands = [self._makehelpcommand()]
+        # Command name lookup, rebuilt after commands change.
+        self._bynames = None
 
     def _makehelpcommand(self):
         return CommandFunc(func=self.helpcommand, name='help')
@@ -178,19 +243,23 @@ class RootMenu:
     def additem(self, item):
         assert isinstance(item, (Command, RootMenu))
         self.commands.append(item)
+        self._bynames = None
 
     def delitem(self, item):
         assert isinstance(item, (Command, RootMenu))
         self.commands.remove(item)
+        self._bynames = None
 
     def __iter__(self):
         return (x.name for x in self.commands)
 
     def __getitem__(self, key):
-        for x in self.commands:
-            if x.name == key:
-                return x
-        raise KeyError()
+        if self._bynames is None:
+            self._bynames = {}
+            for x in self.commands:
+                # First command wins on duplicate names.
+                self._bynames.setdefault(x.name, x)
+        return self._bynames[key]
 
     def _parse(self, string):
         if string == '':
@@ -256,7 +325,7 @@ class SubMenu(RootMenu):
         ''' jump back to parent menu '''
         self.rootmenu.popmenu(self)
         # Remove 'back' menu command, assumes that popmenu is the last command.
-        self.commands.pop()
+        self.delitem(self.commands[-1])
 
     def __call__(self):
         self.rootmenu.pushmenu(self)
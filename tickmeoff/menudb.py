@@ -9,11 +9,25 @@ class TableArgument(menu.EnumArgument):
         self.db = db
         self.table = table
         self.column = column
+        # Column values are cached until the db data version changes.
+        self._version = None
+        self._rowids = []
+        self._values = []
         super().__init__(name=table)
 
+    def _refresh(self):
+        version = self.db.dataversion
+        if version != self._version:
+            rows = dbutil.getall(self.db, 'SELECT rowid, {c} FROM {t} WHERE {c} IS NOT NULL ORDER BY rowid'.format(c=self.column, t=self.table))
+            self._rowids = [r[0] for r in rows]
+            # A new list, so EnumArgument.index knows to rebuild.
+            self._values = [r[1] for r in rows]
+            self._version = version
+
     @property
     def opts(self):
-        return [r[self.column] for r in self._get()]
+        self._refresh()
+        return self._values
 
     @opts.setter
     def opts(self, lst):
@@ -22,12 +36,9 @@ class TableArgument(menu.EnumArgument):
 
     def longmatch(self, string):
         """ overridden so a sqlite.Row is returned. """
+        index = self.index
         matches = []
-        for x in self._get():
-            val = x[self.column]
-            if string.startswith(val):
-                matches.append((x, string[len(val):]))
+        for i in index.prefixes(string):
+            row = dbutil.getone(self.db, 'SELECT * FROM {t} WHERE rowid = ?'.format(t=self.table), self._rowids[i])
+            matches.append((row, string[len(index.opts[i]):]))
         return matches
-
-    def _get(self):
-        return dbutil.getall(self.db, 'SELECT * FROM {}'.format(self.table))
@@ -1,19 +1,73 @@
 """ menu filesystem arguments. """
 
-import itertools
 import os
 import shlex
+import time
 
 from . import menu
 
+# Seconds a cached directory listing is trusted before its mtime is checked again.
+cachettl = 2.0
+
+def scan(path):
+    """ Single pass directory listing, returns (dirs, files).
+    Uses the entry type from the directory itself rather than a stat per entry. """
+    dirs = []
+    files = []
+    with os.scandir(path) as it:
+        for entry in it:
+            # is_dir/is_file only stat symlinks.
+            if entry.is_dir():
+                dirs.append(entry.name + os.path.sep)
+            elif entry.is_file():
+                files.append(entry.name)
+    return dirs, files
+
+class DirCache:
+    """ Directory listings keyed on directory mtime. """
+
+    def __init__(self, ttl=cachettl):
+        self.ttl = ttl
+        # path -> (time checked, mtime, dirs, files, dirs + files)
+        self._entries = {}
+
+    def listing(self, path):
+        """ Return (dirs, files, both) for path. The lists are shared so must not be modified. """
+        path = os.path.normpath(path)
+        now = time.monotonic()
+        try:
+            checked, mtime, *listing = self._entries[path]
+        except KeyError:
+            mtime = None
+        else:
+            if now - checked < self.ttl:
+                return listing
+        st = os.stat(path)
+        if st.st_mtime_ns != mtime:
+            dirs, files = scan(path)
+            listing = [dirs, files, dirs + files]
+        # A change made within the same mtime tick as the listing would go unnoticed,
+        # so don't trust very recent mtimes.
+        if time.time() - st.st_mtime < 1:
+            stamp = None
+        else:
+            stamp = st.st_mtime_ns
+        self._entries[path] = (now, stamp, *listing)
+        return listing
+
+    def clear(self):
+        self._entries.clear()
+
+dircache = DirCache()
+
 def dirs(path):
-    yield from (x + os.path.sep for x in os.listdir(path) if os.path.isdir(os.path.join(path, x)))
+    return dircache.listing(path)[0]
 
 def files(path):
-    yield from (x for x in os.listdir(path) if os.path.isfile(os.path.join(path, x)))
+    return dircache.listing(path)[1]
 
 def ls(path):
-    yield from (x for x in itertools.chain(dirs(path), files(path)))
+    return dircache.listing(path)[2]
 
 def resolvepath(*paths):
     # expanduser only works with ~ at the start of the path, so call for each component
@@ -35,7 +89,8 @@ class BaseListerArgument(menu.EnumArgument):
 
     @property
     def opts(self):
-        return list(self.listfunc(self.cwd))
+        # Cached listings are returned as is, so EnumArgument can keep its index.
+        return self.listfunc(self.cwd)
 
     @opts.setter
     def opts(self, lst):
@@ -66,8 +121,10 @@ class BaseListerArgument(menu.EnumArgument):
         return super().getoptions(filepart)
 
     def parse(self, string):
-        if string is not None:
-            path = shlex.split(string)[0]
+        # A blank string is no argument at all.
+        words = shlex.split(string) if string is not None else []
+        if words:
+            path = words[0]
             fullpath = resolvepath(self.basedir, path)
             if self.checkexists is False or self.exists(fullpath):
                 args = [path]
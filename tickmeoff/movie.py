@@ -1,27 +1,64 @@
 """ unique media key type """
 
+import collections
 import re
+import weakref
 
 from . import dbutil
 
 xwords = {'a', 'for', 'of', 'to', 'the'}
 
 def addmovie(db, title, year, info, syncid):
+    _keyindexes.pop(db, None)
     return dbutil.insert(db, 'INSERT INTO movie (title, yearmade, notes, whenadded, mkey) VALUES (?, ?, ?, ?, ?)', title, year, info, syncid, makekeytitle(title))
 
 def getmovie(db, title, year):
     return dbutil.getone(db, 'SELECT * FROM movie WHERE title = ? AND yearmade = ?', title, year)
 
 def getmovies(db):
-    return dbutil.getall(db, 'SELECT * FROM movie')
+    return dbutil.iterall(db, 'SELECT * FROM movie ORDER BY title, yearmade')
+
+def catalogversion(db):
+    """ Changes whenever movies are added. """
+    return dbutil.getone(db, 'SELECT IFNULL(MAX(movieid), 0) FROM movie')[0]
 
 def search(db, title):
     try:
         key, year = makekeywithyear(title)
     except ValueError:
         return []
+    return searchkey(db, key, year)
+
+def searchkey(db, key, year):
     return dbutil.getall(db, 'SELECT * FROM movie WHERE mkey = ? AND yearmade = ?', key, year)
 
+class KeyIndex:
+    """ In memory (mkey, yearmade) -> movieids lookup over the whole catalog. """
+
+    def __init__(self, db):
+        self.version = catalogversion(db)
+        movies = collections.defaultdict(list)
+        for r in dbutil.iterall(db, 'SELECT movieid, mkey, yearmade FROM movie ORDER BY movieid'):
+            movies[(r[1], r[2])].append(r[0])
+        # Tuples are smaller than lists.
+        self._movies = {k: tuple(v) for k, v in movies.items()}
+
+    def search(self, key, year):
+        return self._movies.get((key, year), ())
+
+    def __len__(self):
+        return len(self._movies)
+
+# Cached KeyIndex per db.
+_keyindexes = weakref.WeakKeyDictionary()
+
+def getkeyindex(db):
+    """ KeyIndex for db, reloaded whenever movies have been added. """
+    index = _keyindexes.get(db)
+    if index is None or index.version != catalogversion(db):
+        index = _keyindexes[db] = KeyIndex(db)
+    return index
+
 def makekeywithyear(title):
     # Always assuming year is 4 digits.
     # title (year)
@@ -31,8 +68,14 @@ def makekeywithyear(title):
     left, year, right = re.split(r'.(\d{4})', title, maxsplit=1)
     return makekeytitle(left), int(year)
 
+# Drop apostrophes, other punctuation becomes a space.
+_punctuation = str.maketrans({"'": None, **{c: ' ' for c in '[].,():-'}})
+
 def makekeytitle(title):
     # lower case and remove punctuation.
-    apost = title.lower().replace("'", '')
-    spaced = re.sub(r"[[\]\.,'():-]", " ", apost)
-    return " ".join(sorted(set(spaced.strip().split()) - xwords))
+    spaced = title.lower().translate(_punctuation)
+    return " ".join(sorted(set(spaced.split()) - xwords))
+
+def makekeytitles(titles):
+    """ makekeytitle for a batch of titles. """
+    return [makekeytitle(t) for t in titles]
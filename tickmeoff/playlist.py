@@ -3,31 +3,181 @@ Playlist writing module.
 Copyright (c) 2018 Acke, see LICENSE file for allowable usage.
 """
 
+import contextlib
+import hashlib
 import os
+import pathlib
+import time
+from xml.sax.saxutils import escape
+
+class PlaylistWriter:
+    """ Writes a playlist format to a temporary file, then renames it over filename if its content changed. """
+
+    def __init__(self, filename):
+        self.filename = os.path.expanduser(filename)
+        self.destdir = os.path.dirname(self.filename)
+        self.count = 0
+        self.hash = hashlib.sha256()
+
+    def __enter__(self):
+        # Ensure basedir exists.
+        os.makedirs(self.destdir, exist_ok=True)
+        self.tmpname = os.path.join(self.destdir, '.{}.tmp'.format(os.path.basename(self.filename)))
+        self.f = open(self.tmpname, 'wb')
+        self.header()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.footer()
+        self.f.close()
+        self.changed = exc_type is None and filehash(self.filename) != self.hash.digest()
+        if self.changed:
+            os.replace(self.tmpname, self.filename)
+        else:
+            os.unlink(self.tmpname)
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.hash.update(data)
+        self.f.write(data)
+
+    def add(self, label, fullpath, duration=None):
+        self.count += 1
+        self.entry(label, fullpath, duration)
+
+    def header(self):
+        pass
+
+    def entry(self, label, fullpath, duration):
+        """ Write an entry, duration is in seconds or None if it's unknown. """
+        raise NotImplementedError
+
+    def footer(self):
+        pass
+
+class M3UWriter(PlaylistWriter):
+    """ Extended M3U, UTF-8 encoded. Paths are relative to the playlist. """
+
+    def header(self):
+        self.write('#EXTM3U\n\n')
+
+    def entry(self, label, fullpath, duration):
+        self.write('#EXTINF:{},{}\n{}\n\n'.format(seconds(duration), label, os.path.relpath(fullpath, self.destdir)))
+
+class PLSWriter(PlaylistWriter):
+
+    def header(self):
+        self.write('[playlist]\n')
+
+    def entry(self, label, fullpath, duration):
+        self.write('File{n}={path}\nTitle{n}={label}\nLength{n}={length}\n'.format(n=self.count, path=fullpath, label=label, length=seconds(duration)))
+
+    def footer(self):
+        self.write('NumberOfEntries={}\nVersion=2\n'.format(self.count))
+
+class XSPFWriter(PlaylistWriter):
+
+    def header(self):
+        self.write('<?xml version="1.0" encoding="UTF-8"?>\n<playlist version="1" xmlns="http://xspf.org/ns/0/">\n  <trackList>\n')
+
+    def entry(self, label, fullpath, duration):
+        self.write('    <track>\n      <location>{}</location>\n      <title>{}</title>\n'.format(
+            escape(pathlib.Path(os.path.abspath(fullpath)).as_uri()), escape(label)))
+        if duration is not None:
+            # In milliseconds.
+            self.write('      <duration>{}</duration>\n'.format(round(duration * 1000)))
+        self.write('    </track>\n')
+
+    def footer(self):
+        self.write('  </trackList>\n</playlist>\n')
+
+formats = {
+    'm3u': M3UWriter,
+    'pls': PLSWriter,
+    'xspf': XSPFWriter,
+    }
+
+def seconds(duration):
+    """ Whole seconds for m3u/pls, which use -1 for unknown. """
+    return -1 if duration is None else round(duration)
+
+def filehash(filename):
+    """ sha256 digest of filename's content, None if it doesn't exist. """
+    h = hashlib.sha256()
+    try:
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                h.update(chunk)
+    except FileNotFoundError:
+        return None
+    return h.digest()
+
+def writeplaylists(outputs, movs):
+    """ Write the (label, fullpath[, duration]) iterable to each {format: filename} output in a single pass.
+    Returns {filename: True if it was rewritten, False if its content was unchanged}. """
+    with contextlib.ExitStack() as stack:
+        writers = [stack.enter_context(formats[fmt](filename)) for fmt, filename in outputs.items()]
+        for mov in movs:
+            for w in writers:
+                w.add(*mov)
+    return {w.filename: w.changed for w in writers}
 
 def writem3u(filename, movs):
-    fp = os.path.expanduser(filename)
-    destdir = os.path.dirname(fp)
-    # Ensure basedir exists.
-    os.makedirs(destdir, exist_ok=True)
-    with open(fp, 'w+') as f:
-        print('#EXTM3U', file=f)
-        print('', file=f)
-        for label, fullpath in movs:
-            # length/duration not supported yet so hardcode -1 for now.
-            print('#EXTINF:-1,{}'.format(label), file=f)
-            print(os.path.relpath(fullpath, destdir), file=f)
-            print('', file=f)
-
-def makesymlinks(basedir, movs):
+    return writeplaylists({'m3u': filename}, movs)
+
+def readlinks(basedir):
+    """ {name: target} of the symlinks (ONLY) in basedir. """
+    links = {}
+    try:
+        with os.scandir(basedir) as it:
+            for entry in it:
+                if entry.is_symlink():
+                    links[entry.name] = os.readlink(entry.path)
+    except FileNotFoundError:
+        pass
+    return links
+
+def _replacelink(target, path):
+    """ Atomically point symlink path at target by renaming a new link over it. """
+    tmppath = os.path.join(os.path.dirname(path), '.{}.tmp'.format(os.path.basename(path)))
+    try:
+        os.symlink(target, tmppath)
+    except FileExistsError:
+        # Left over from an interrupted sync.
+        os.unlink(tmppath)
+        os.symlink(target, tmppath)
+    os.replace(tmppath, path)
+
+def makesymlinks(basedir, movs, dryrun=False):
+    """ Sync the symlinks in basedir to the (label, dirpath) list, only changed links are touched.
+    Labels that are already taken by something other than a symlink are left alone and reported as blocked.
+    Returns {'created': labels, 'retargeted': labels, 'removed': labels, 'blocked': labels, 'unchanged': count, 'elapsed': seconds}. """
+    start = time.perf_counter()
     fp = os.path.expanduser(basedir)
-    # Ensure basedir exists.
-    os.makedirs(fp, exist_ok=True)
-    # Remove all existing symlinks (ONLY).
-    for f in os.listdir(fp):
-        path = os.path.join(fp, f)
-        if os.path.islink(path):
-            os.unlink(path)
-    # Link items.
-    for label, dirpath in movs:
-        os.symlink(dirpath, os.path.join(os.path.relpath(fp, dirpath), label))
+    wanted = dict(movs)
+    existing = readlinks(fp)
+    new = [x for x in wanted if x not in existing]
+    changes = {
+        'created': sorted(x for x in new if not os.path.lexists(os.path.join(fp, x))),
+        'retargeted': sorted(x for x in wanted if x in existing and existing[x] != wanted[x]),
+        'removed': sorted(x for x in existing if x not in wanted),
+        }
+    changes['blocked'] = sorted(set(new) - set(changes['created']))
+    changes['unchanged'] = len(wanted) - len(new) - len(changes['retargeted'])
+    if not dryrun:
+        # Ensure basedir exists.
+        os.makedirs(fp, exist_ok=True)
+        for label in changes['removed']:
+            os.unlink(os.path.join(fp, label))
+        for label in list(changes['created']):
+            try:
+                # Not replaced, so that nothing that turned up since the check is overwritten.
+                os.symlink(wanted[label], os.path.join(fp, label))
+            except FileExistsError:
+                changes['created'].remove(label)
+                changes['blocked'].append(label)
+        for label in changes['retargeted']:
+            _replacelink(wanted[label], os.path.join(fp, label))
+    changes['elapsed'] = time.perf_counter() - start
+    return changes
@@ -0,0 +1,190 @@
+"""
+Media duration probing from file headers only, and content fingerprints.
+Copyright (c) 2018 Acke, see LICENSE file for allowable usage.
+
+Only the few headers or blocks needed are read, never all of the media data.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+
+# Matroska/WebM element IDs, marker bits included.
+EBML = 0x1A45DFA3
+SEGMENT = 0x18538067
+INFO = 0x1549A966
+CLUSTER = 0x1F43B675
+TIMECODESCALE = 0x2AD7B1
+DURATION = 0x4489
+
+# Info is normally well under this, anything bigger isn't worth reading.
+maxheader = 1 << 20
+
+# Fingerprint block size.
+blocksize = 1 << 16
+
+def _vint(buf, off, marker):
+    """ Decode an EBML variable length integer at off. Returns (value, length), value is None for unknown sizes. """
+    first = buf[off]
+    length = 9 - first.bit_length()
+    if first == 0 or off + length > len(buf):
+        raise ValueError('bad EBML vint')
+    value = first if marker else first & (0xFF >> length)
+    for x in buf[off + 1:off + length]:
+        value = (value << 8) | x
+    if not marker and value == (1 << (7 * length)) - 1:
+        value = None
+    return value, length
+
+def _element(buf, off):
+    """ Returns (id, size, data offset) of the EBML element at off. """
+    eid, idlen = _vint(buf, off, marker=True)
+    size, sizelen = _vint(buf, off + idlen, marker=False)
+    return eid, size, off + idlen + sizelen
+
+def _fileelement(fd, pos):
+    eid, size, dataoff = _element(os.pread(fd, 12, pos), 0)
+    return eid, size, pos + dataoff
+
+def _matroska(fd, filesize):
+    eid, size, pos = _fileelement(fd, 0)
+    if eid != EBML or size is None:
+        return None
+    eid, size, pos = _fileelement(fd, pos + size)
+    if eid != SEGMENT:
+        return None
+    end = filesize if size is None else min(filesize, pos + size)
+    # Skip over the segment's top level elements until Info, it comes before the clusters.
+    while pos < end:
+        eid, size, datapos = _fileelement(fd, pos)
+        if eid == INFO and size is not None and size <= maxheader:
+            if datapos + size > end:
+                raise ValueError('Matroska Info overruns the segment')
+            return _matroskainfo(os.pread(fd, size, datapos))
+        if eid == CLUSTER or size is None:
+            return None
+        pos = datapos + size
+    return None
+
+def _matroskainfo(buf):
+    scale = 1000000
+    duration = None
+    off = 0
+    while off < len(buf):
+        eid, size, dataoff = _element(buf, off)
+        if size is None or dataoff + size > len(buf):
+            raise ValueError('bad Matroska Info element size')
+        data = buf[dataoff:dataoff + size]
+        if eid == TIMECODESCALE:
+            scale = int.from_bytes(data, 'big')
+        elif eid == DURATION:
+            duration = struct.unpack('>f' if size == 4 else '>d', data)[0]
+        off = dataoff + size
+    if duration is None:
+        return None
+    # Duration is in TimecodeScale nanosecond units.
+    return duration * scale / 1e9
+
+def _boxes(fd, pos, end):
+    """ yield (type, data pos, end pos) for the MP4 boxes between pos and end. """
+    while pos + 8 <= end:
+        hdr = os.pread(fd, 16, pos)
+        size, kind = struct.unpack('>I4s', hdr[:8])
+        hdrlen = 8
+        if size == 1:
+            size = struct.unpack('>Q', hdr[8:16])[0]
+            hdrlen = 16
+        elif size == 0:
+            # Runs to the end of the file.
+            size = end - pos
+        if size < hdrlen:
+            raise ValueError('bad MP4 box size')
+        yield kind, pos + hdrlen, pos + size
+        pos += size
+
+def _mp4(fd, filesize):
+    # moov is often after mdat, but skipping over mdat is just another box header read.
+    for kind, pos, end in _boxes(fd, 0, filesize):
+        if kind == b'moov':
+            for kind, pos, end in _boxes(fd, pos, end):
+                if kind == b'mvhd':
+                    buf = os.pread(fd, 32, pos)
+                    if buf[0] == 1:
+                        timescale, duration = struct.unpack('>IQ', buf[20:32])
+                    else:
+                        timescale, duration = struct.unpack('>II', buf[12:20])
+                        if duration == 0xFFFFFFFF:
+                            return None
+                    return duration / timescale if timescale else None
+            return None
+    return None
+
+def _chunks(buf, off, end):
+    """ yield (fourcc, data offset, size) for the RIFF chunks in buf. """
+    while off + 8 <= end:
+        fourcc, size = struct.unpack('<4sI', buf[off:off + 8])
+        yield fourcc, off + 8, size
+        # Chunks are word aligned.
+        off += 8 + size + (size & 1)
+
+def _avi(fd, filesize):
+    head = os.pread(fd, 24, 0)
+    if head[12:16] != b'LIST' or head[20:24] != b'hdrl':
+        return None
+    size = struct.unpack('<I', head[16:20])[0]
+    if size > maxheader:
+        return None
+    hdrl = os.pread(fd, size - 4, 24)
+    usecs = frames = None
+    for fourcc, off, size in _chunks(hdrl, 0, len(hdrl)):
+        if fourcc == b'avih':
+            usecs, _, _, _, frames = struct.unpack('<5I', hdrl[off:off + 20])
+        elif fourcc == b'LIST' and hdrl[off:off + 4] == b'odml':
+            # OpenDML (>1GB) files only count the first RIFF's frames in avih.
+            for sub, suboff, subsize in _chunks(hdrl, off + 4, off + size):
+                if sub == b'dmlh':
+                    frames = struct.unpack('<I', hdrl[suboff:suboff + 4])[0]
+    if not usecs or not frames:
+        return None
+    return usecs * frames / 1e6
+
+def _probe(fd, filesize):
+    magic = os.pread(fd, 12, 0)
+    if magic[:4] == EBML.to_bytes(4, 'big'):
+        return _matroska(fd, filesize)
+    elif magic[:4] == b'RIFF' and magic[8:12] == b'AVI ':
+        return _avi(fd, filesize)
+    elif magic[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide'):
+        return _mp4(fd, filesize)
+    return None
+
+def duration(path):
+    """ Duration in seconds of a Matroska/WebM, MP4/M4V or AVI file. None if it's unknown or can't be read. """
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return _probe(fd, os.fstat(fd).st_size)
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    finally:
+        os.close(fd)
+
+def fingerprint(path):
+    """ Cheap content fingerprint: the size and a hash of the first, middle and last blocks.
+    None for empty files, or if it can't be read. """
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return None
+            h = hashlib.blake2b(digest_size=16)
+            # Only the pages that are sliced get read in.
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for off in sorted({0, max(0, (size - blocksize) // 2), max(0, size - blocksize)}):
+                    h.update(m[off:off + blocksize])
+    except (OSError, ValueError):
+        return None
+    return '{}:{}'.format(size, h.hexdigest())
@@ -0,0 +1,37 @@
+""" Chart reports, each one a single query over the rankings. """
+
+from . import chartsource
+from . import dbutil
+
+# Rankings as at asat, or the chart source's latest sync when asat is None. A None source is the default chart's.
+_asat = '''r.asat = IFNULL(?, (SELECT whensynced FROM sync
+        WHERE sourceid = IFNULL(?, (SELECT sourceid FROM chartsource WHERE name = ?)) ORDER BY syncid DESC LIMIT 1))'''
+
+# A movie's media is the first file found for it.
+_firstmedia = 'mf.mediafileid = (SELECT MIN(mediafileid) FROM mediafile WHERE movieid = r.movieid)'
+
+_mediacols = "rtrim(l.fullpath, '/') || '/' || mf.filename AS path, mf.duration"
+
+def ranked(db, asat=None, sourceid=None):
+    """ yield ranking rows along with the path and duration of their media, path is None for missing media.
+    Rankings are of the top chart unless sourceid is given. """
+    return dbutil.iterall(db, '''SELECT r.indexnum, m.*, {media} FROM rank r
+            JOIN movie m ON r.movieid = m.movieid
+            LEFT JOIN mediafile mf ON {firstmedia}
+            LEFT JOIN location l ON mf.locationid = l.locationid
+            WHERE {asat} ORDER BY r.indexnum'''.format(media=_mediacols, firstmedia=_firstmedia, asat=_asat), asat, sourceid, chartsource.defaultsource)
+
+def rankedpaths(db, asat=None, sourceid=None):
+    """ yield ranking rows that have media, along with its path and duration. """
+    return dbutil.iterall(db, '''SELECT r.indexnum, m.*, {media} FROM rank r
+            JOIN movie m ON r.movieid = m.movieid
+            JOIN mediafile mf ON {firstmedia}
+            JOIN location l ON mf.locationid = l.locationid
+            WHERE {asat} ORDER BY r.indexnum'''.format(media=_mediacols, firstmedia=_firstmedia, asat=_asat), asat, sourceid, chartsource.defaultsource)
+
+def missing(db, asat=None, sourceid=None):
+    """ yield ranking rows without media. """
+    return dbutil.iterall(db, '''SELECT r.indexnum, m.* FROM rank r
+            JOIN movie m ON r.movieid = m.movieid
+            WHERE {asat} AND NOT EXISTS (SELECT 1 FROM mediafile WHERE movieid = r.movieid)
+            ORDER BY r.indexnum'''.format(asat=_asat), asat, sourceid, chartsource.defaultsource)
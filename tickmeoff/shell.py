@@ -1,10 +1,12 @@
-import operator
+import json
 import os
 import readline
 import time
 import traceback
 
 from . import tickmeoff
+from . import catalog
+from . import chartsource
 from . import config
 from . import easter
 from . import mediafile
@@ -13,6 +15,7 @@ from . import menudb
 from . import menuls
 from . import movie
 from . import playlist
+from . import report
 from . import ticks
 
 class App:
@@ -32,14 +35,29 @@ class App:
         pm.additem(menu.CommandFunc(self.addpath, patharg, name='add'))
         dbpatharg = menudb.TableArgument(self.db, table='location', column='pathname')
         pm.additem(menu.CommandFunc(self.deletepath, dbpatharg, name='delete'))
-        pm.additem(menu.CommandFunc(self.scan))
+        scanargs = menu.CompositeArgument(menu.EnumArgument(name='option', opts=['--full']), menu.NoArgument(name='incremental'))
+        pm.additem(menu.CommandFunc(self.scan, scanargs))
+        pm.additem(menu.CommandFunc(self.reconcile))
         m.additem(pm)
-        m.additem(menu.CommandFunc(self.missing))
-        m.additem(menu.CommandFunc(self.punted))
-        m.additem(menu.CommandFunc(self.diffs))
-        m.additem(menu.CommandFunc(self.rankings))
-        m.additem(menu.CommandFunc(self.link))
-        m.additem(menu.CommandFunc(self.write))
+        sm = menu.SubMenu(name='sources', rootmenu=m)
+        sm.additem(menu.CommandFunc(self.sourcelist, name='list'))
+        sm.additem(menu.CommandFunc(self.sourceadd, menu.StringArgument(name='name url'), name='add'))
+        sourcearg = menudb.TableArgument(self.db, table='chartsource', column='name')
+        sm.additem(menu.CommandFunc(self.sourceenable, sourcearg, name='enable'))
+        sm.additem(menu.CommandFunc(self.sourcedisable, sourcearg, name='disable'))
+        m.additem(sm)
+        # Reports are of the top chart unless a source is given.
+        chartarg = menu.CompositeArgument(sourcearg, menu.NoArgument(name=chartsource.defaultsource))
+        m.additem(menu.CommandFunc(self.missing, chartarg))
+        m.additem(menu.CommandFunc(self.punted, chartarg))
+        m.additem(menu.CommandFunc(self.diffs, chartarg))
+        m.additem(menu.CommandFunc(self.rankings, chartarg))
+        dryrunarg = menu.EnumArgument(name='option', opts=['--dry-run'])
+        linkargs = (menu.CompositeArgument(sourcearg, dryrunarg, menu.NoArgument(name=chartsource.defaultsource)),
+                menu.CompositeArgument(dryrunarg, menu.NoArgument(name='sync')))
+        m.additem(menu.CommandFunc(self.link, *linkargs))
+        m.additem(menu.CommandFunc(self.write, chartarg))
+        m.additem(menu.CommandFunc(self.catalog, menuls.FileArgument(name='dataset')))
         cm = menu.SubMenu(name='config', rootmenu=m)
         ckeyarg = menudb.TableArgument(self.db, table='config', column='key')
         cgetargs = menu.CompositeArgument(ckeyarg, menu.NoArgument(name='getall'))
@@ -61,25 +79,55 @@ class App:
         dm.additem(menu.CommandFunc(self.fileimport, impargs))
         dm.additem(menu.CommandFunc(self.moviekeys))
         dm.additem(menu.CommandFunc(self.scanfile))
+        statsargs = menu.CompositeArgument(menu.EnumArgument(name='action', opts=['on', 'off', 'reset', 'json']), menu.NoArgument(name='show'))
+        dm.additem(menu.CommandFunc(self.stats, statsargs))
         m.additem(dm)
         return m
 
     def download(self, *args, **kwargs):
-        """ download and import listing """
-        self._import(tickmeoff.download, None)
-        self.db.commit()
+        """ download and import the enabled chart sources """
+        with self.db.useprofile('bulk'):
+            for source, result in tickmeoff.downloadall(self.db):
+                print('{}:'.format(source['name']))
+                if isinstance(result, Exception):
+                    print('Download failed: {}'.format(result))
+                else:
+                    self._printimport(result)
+
+    def sourcelist(self, *args, **kwargs):
+        """ list chart sources """
+        for s in chartsource.getsources(self.db):
+            print('{:16} {:8} {:6} {}'.format(s['name'], 'enabled' if s['enabled'] else 'disabled', s['parser'], s['url']))
+
+    def sourceadd(self, *args, **kwargs):
+        """ add a chart source """
+        name, url = args[0].split()
+        with self.db.transaction():
+            chartsource.addsource(self.db, name, url)
+
+    def sourceenable(self, *args, **kwargs):
+        """ enable a chart source """
+        with self.db.transaction():
+            chartsource.setenabled(self.db, args[0]['sourceid'], True)
+
+    def sourcedisable(self, *args, **kwargs):
+        """ disable a chart source """
+        with self.db.transaction():
+            chartsource.setenabled(self.db, args[0]['sourceid'], False)
 
     def history(self, *args, **kwargs):
         """ list download history """
-        for h in tickmeoff.gethistory(self.db):
-            print('{:<3} {}'.format(h['syncid'], formatsync(h)))
+        with self.db.snapshot() as db:
+            for h in tickmeoff.gethistory(db):
+                print('{:<3} {}'.format(h['syncid'], formatsync(h)))
 
     def movies(self, *args, **kwargs):
         """ show movie listing """
-        movs = movie.getmovies(self.db)
-        for m in sorted(movs, key=operator.itemgetter('title', 'yearmade')):
-            print('({year}): {title} - {notes}'.format(title=m['title'], year=m['yearmade'], notes=m['notes']))
-        print('{} in total'.format(len(movs)))
+        count = 0
+        with self.db.snapshot() as db:
+            for count, m in enumerate(movie.getmovies(db), 1):
+                print('({year}): {title} - {notes}'.format(title=m['title'], year=m['yearmade'], notes=m['notes']))
+        print('{} in total'.format(count))
 
     def addpath(self, *args, **kwargs):
         """ add given path to list of dirs to scan """
@@ -88,8 +136,8 @@ class App:
             if mediafile.getlocation(self.db, p):
                 print('already have that one')
             else:
-                mediafile.addlocation(self.db, p)
-                self.db.commit()
+                with self.db.transaction():
+                    mediafile.addlocation(self.db, p)
         else:
             print('need path')
 
@@ -97,8 +145,8 @@ class App:
         """ delete path from list of dirs to scan """
         if len(args) == 1:
             row = args[0]
-            mediafile.deletelocation(self.db, row['locationid'])
-            self.db.commit()
+            with self.db.transaction():
+                mediafile.deletelocation(self.db, row['locationid'])
         else:
             print('need path')
 
@@ -108,33 +156,67 @@ class App:
             print(p['pathname'])
 
     def scan(self, *args, **kwargs):
-        """ scan known paths for media """
-        new = mediafile.scanpaths(self.db)
+        """ scan known paths for media, --full to rescan unchanged directories too """
+        with self.db.useprofile('bulk'):
+            new, counts = mediafile.scanpaths(self.db, full='--full' in args)
+            # Files from before durations were probed.
+            probed = mediafile.probemissing(self.db)
+        self.db.commit()
         for f in new:
             print(f)
         print('{} new media files added'.format(len(new)))
+        print('{} directories visited, {} unchanged skipped'.format(counts['visited'], counts['skipped']))
+        if counts['moved']:
+            print('{} moved media files followed'.format(counts['moved']))
+        if probed:
+            print('{} older media files probed'.format(probed))
+
+    def catalog(self, *args, **kwargs):
+        """ add the movies in a title dataset (gzipped tsv, eg. title.basics.tsv.gz) to the catalog """
+        if not args:
+            print('need dataset file')
+            return
+        def progress(read, added):
+            print('\r{} titles read, {} movies added'.format(read, added), end='', flush=True)
+        start = time.perf_counter()
+        with self.db.useprofile('bulk'):
+            read, added = catalog.loadtitles(self.db, args[0], progress=progress)
+        print('\r{} titles read, {} movies added in {:.1f}s'.format(read, added, time.perf_counter() - start))
+
+    def reconcile(self, *args, **kwargs):
+        """ forget media files that no longer exist """
+        with self.db.transaction():
+            gone = mediafile.reconcile(self.db)
+        print('{} missing media files removed'.format(gone))
 
     def _printranks(self, movs):
         for m in movs:
             print('{rank}: {title}({year}) - {notes}'.format(rank=m['indexnum'], title=m['title'], year=m['yearmade'], notes=m['notes']))
 
+    def _sourceid(self, args):
+        """ sourceid of the chart source argument, None (the default chart) if there isn't one. """
+        for a in args:
+            if not isinstance(a, str):
+                return a['sourceid']
+        return None
+
     def missing(self, *args, **kwargs):
-        """ list missing media from the latest ranking """
-        miss = []
-        for r in tickmeoff.getrankings(self.db):
-            mf = mediafile.getmediafile(self.db, movieid=r['movieid'])
-            if mf is None:
-                miss.append(r)
-        self._printranks(miss)
+        """ list missing media from the latest ranking of a chart source, top by default """
+        with self.db.snapshot() as db:
+            self._printranks(report.missing(db, sourceid=self._sourceid(args)))
 
     def punted(self, *args, **kwargs):
-        """ list movies that have been dropped from the rankings """
-        for m in tickmeoff.getpunted(self.db):
+        """ list movies that have been dropped from a chart source's rankings, top by default """
+        with self.db.snapshot() as db:
+            punted = tickmeoff.getpunted(db, sourceid=self._sourceid(args))
+        for m in punted:
             print('{year} ({i:3}) {title}'.format(year=m['yearmade'], title=m['title'], i=m['indexnum']))
 
     def diffs(self, *args, **kwargs):
-        """ list differences in movie rank position """
-        for m in tickmeoff.getdiffs(self.db):
+        """ list differences in movie rank position of a chart source, top by default """
+        with self.db.snapshot() as db:
+            diffs = list(tickmeoff.getdiffs(db, sourceid=self._sourceid(args)))
+        for m in diffs:
             # Format the diff.
             if m['diff'] is None:
                 # New entry
@@ -148,8 +230,9 @@ class App:
             print('{i:3}) {diff} {year} {title}'.format(diff=diff, year=m['yearmade'], title=m['title'], i=m['indexnum']))
 
     def rankings(self, *args, **kwargs):
-        """ show latest movie rankings """
-        self._printranks(tickmeoff.getrankings(self.db))
+        """ show the latest movie rankings of a chart source, top by default """
+        with self.db.snapshot() as db:
+            self._printranks(tickmeoff.getrankings(db, sourceid=self._sourceid(args)))
 
     def configget(self, *args, **kwargs):
         """ show config settings """
@@ -166,43 +249,52 @@ class App:
     def configset(self, *args, **kwargs):
         """ set a config item """
         key, value = args[0].split()
-        config.setconfig(self.db, key, value)
-        self.db.commit()
+        with self.db.transaction():
+            config.setconfig(self.db, key, value)
 
     def ticklist(self, *args, **kwargs):
         """ list ticked items """
-        for tick in ticks.getmarks(self.db):
-            print('{} {}'.format(time.strftime('%c', time.localtime(tick['datetime'])), tick['title']))
+        with self.db.snapshot() as db:
+            for tick in ticks.getmarks(db):
+                print('{} {}'.format(time.strftime('%c', time.localtime(tick['datetime'])), tick['title']))
 
     def tickmark(self, *args, **kwargs):
         """ mark/tick watched movie """
-        ticks.markmovie(self.db, args[0])
-        self.db.commit()
+        with self.db.transaction():
+            ticks.markmovie(self.db, args[0])
 
     def link(self, *args, **kwargs):
-        """ create soft links for media files """
+        """ sync soft links for a chart source's media files (top by default), --dry-run to only show the changes """
         got = []
-        for r, path in self._getrankedmedia():
-            # Link the parent directory using label.
-            label = '{rank}) {title} ({year})'.format(rank=r['indexnum'], title=r['title'], year=r['yearmade'], notes=r['notes'])
-            got.append((label, os.path.dirname(path)))
-        playlist.makesymlinks(config.getconfig(self.db, 'linkdir')['value'], got)
+        with self.db.snapshot() as db:
+            for r in report.rankedpaths(db, sourceid=self._sourceid(args)):
+                # Link the parent directory using label.
+                label = '{rank}) {title} ({year})'.format(rank=r['indexnum'], title=r['title'], year=r['yearmade'], notes=r['notes'])
+                got.append((label, os.path.dirname(os.path.expanduser(r['path']))))
+        dryrun = '--dry-run' in args
+        changes = playlist.makesymlinks(config.getconfig(self.db, 'linkdir')['value'], got, dryrun=dryrun)
+        for action in ('created', 'retargeted', 'removed', 'blocked'):
+            for label in changes[action]:
+                print('{:10} {}'.format(action, label))
+        print('{}{} created, {} retargeted, {} removed, {} unchanged in {:.1f} ms'.format('dry run: ' if dryrun else '',
+            len(changes['created']), len(changes['retargeted']), len(changes['removed']), changes['unchanged'], changes['elapsed'] * 1000))
+        if changes['blocked']:
+            print('{} not linked, something other than a link has the same name'.format(len(changes['blocked'])))
 
     def write(self, *args, **kwargs):
-        """ write m3u playlist file """
-        got = []
-        for r, path in self._getrankedmedia():
-            # m3u uses (label, path)
-            label = '{rank}: {title}({year}) - {notes}'.format(rank=r['indexnum'], title=r['title'], year=r['yearmade'], notes=r['notes'])
-            got.append((label, path))
-        playlist.writem3u(config.getconfig(self.db, 'm3ufile')['value'], got)
-
-    def _getrankedmedia(self):
-        for r in tickmeoff.getrankings(self.db):
-            mf = mediafile.getmediafile(self.db, movieid=r['movieid'])
-            if mf:
-                path = os.path.expanduser(mediafile.getpathr(self.db, mf['locationid']))
-                yield r, os.path.join(path, mf['filename'])
+        """ write playlist files of a chart source (top by default), in each format that's configured """
+        outputs = {}
+        for fmt in playlist.formats:
+            filename = config.getconfig(self.db, '{}file'.format(fmt))['value']
+            if filename != 'none':
+                outputs[fmt] = filename
+        with self.db.snapshot() as db:
+            # Playlists use (label, path, duration)
+            movs = (('{rank}: {title}({year}) - {notes}'.format(rank=r['indexnum'], title=r['title'], year=r['yearmade'], notes=r['notes']),
+                os.path.expanduser(r['path']), r['duration']) for r in report.rankedpaths(db, sourceid=self._sourceid(args)))
+            written = playlist.writeplaylists(outputs, movs)
+        for filename, changed in written.items():
+            print('{} {}'.format('written  ' if changed else 'unchanged', filename))
 
     def commit(self, *args, **kwargs):
         """ DEBUG: save changes to database. """
@@ -224,23 +316,50 @@ class App:
             infile = args[0]
         else:
             infile = 'chart.html'
-        self._import(tickmeoff.fileimport, infile)
+        with self.db.useprofile('bulk'):
+            self._import(tickmeoff.fileimport, infile)
 
     def moviekeys(self, *args, **kwargs):
         """ DEBUG: List internal movie keys for movies list. """
-        movs = movie.getmovies(self.db)
-        for m in sorted(movs, key=operator.itemgetter('title', 'yearmade')):
+        count = 0
+        for count, m in enumerate(movie.getmovies(self.db), 1):
             print('({year}): {title} -> {key}'.format(title=m['title'], year=m['yearmade'], key=m['mkey']))
-        print('{} in total'.format(len(movs)))
+        print('{} in total'.format(count))
 
     def scanfile(self, *args, **kwargs):
         """ DEBUG: Scan media files from filelist.txt as if it was a filesystem. """
         for key, filename, location in mediafile.scanfiles(self.db, 'filelist.txt'):
             print('{} {}'.format(key, filename))
 
-    def _import(self, func, infile='chart.html'):
+    def stats(self, *args, **kwargs):
+        """ DEBUG: show query stats. Use on/off/reset to control collection, json to dump. """
+        action = args[0] if args else None
+        if action == 'on':
+            self.db.settrace(True)
+        elif action == 'off':
+            self.db.settrace(False)
+        elif self.db.stats is None:
+            print('query stats are off, use "debug stats on" to collect them')
+        elif action == 'reset':
+            self.db.stats.reset()
+        elif action == 'json':
+            print(json.dumps(self.db.stats.dump(), indent=2))
+        else:
+            dump = self.db.stats.dump()
+            print('{:>6} {:>10} {:>8} {:>8}  {}'.format('calls', 'total ms', 'max ms', 'rows', 'query'))
+            for q in dump['queries']:
+                print('{calls:6} {total:10.2f} {max:8.2f} {rows:8}  {query}'.format(calls=q['calls'], total=q['total'] * 1000, max=q['max'] * 1000, rows=q['rows'], query=q['query']))
+            print('{} statements executed by sqlite'.format(dump['executed']))
+
+    def _import(self, func, *args):
         """ Internal func for downloading/importing etc. """
-        newmovies, rankings = func(self.db, filename=infile)
+        self._printimport(func(self.db, *args))
+
+    def _printimport(self, imported):
+        if imported is None:
+            print('Chart unchanged since the last sync')
+            return
+        newmovies, rankings = imported
         if len(rankings):
             self._printranks(newmovies)
             print('Chart successfully imported: {} new movies'.format(len(newmovies)))
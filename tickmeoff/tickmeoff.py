@@ -2,95 +2,238 @@
 
 __version__ = '0.1'
 
+import codecs
+import concurrent.futures
+import hashlib
 import time
+import urllib.error
 import urllib.request as ur
+import zlib
 
+from . import chartsource
 from . import dbutil
 from . import imdb
 from . import movie
 
-def openurl(url):
-    req = ur.Request(url)
-    return ur.urlopen(req)
+defaulturl = 'https://imdb.com/chart/top'
+
+def openurl(url, headers={}, timeout=None):
+    req = ur.Request(url, headers=headers)
+    if timeout is None:
+        return ur.urlopen(req)
+    return ur.urlopen(req, timeout=timeout)
+
+class DecodedResponse:
+    """ File-like response body, gzip or deflate content encoding is decompressed as it's read. """
+
+    def __init__(self, resp):
+        self.resp = resp
+        encoding = resp.headers.get('Content-Encoding', '').lower()
+        self.raw = encoding == 'deflate'
+        # Auto-detects gzip or zlib headers.
+        self.z = zlib.decompressobj(zlib.MAX_WBITS | 32) if encoding in ('gzip', 'x-gzip', 'deflate') else None
+
+    def read(self, size=-1):
+        if self.z is None:
+            return self.resp.read(size)
+        while True:
+            chunk = self.resp.read(size)
+            if not chunk:
+                return self.z.flush()
+            try:
+                data = self.z.decompress(chunk)
+            except zlib.error:
+                if not self.raw:
+                    raise
+                # Some servers send deflate without the zlib header.
+                self.raw = False
+                self.z = zlib.decompressobj(-zlib.MAX_WBITS)
+                data = self.z.decompress(chunk)
+            # Only the first chunk tells raw deflate apart.
+            self.raw = False
+            if data:
+                return data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.resp.close()
+
+def gethttpcache(db, url):
+    return dbutil.getone(db, 'SELECT * FROM httpcache WHERE url = ?', url)
+
+def sethttpcache(db, url, etag, lastmodified):
+    dbutil.upsert(db, 'httpcache', 'url', url=url, etag=etag, lastmodified=lastmodified)
+
+def conditionalheaders(db, url):
+    """ Request headers for a conditional GET of url, using the validators saved from the last fetch. """
+    headers = {'Accept-Encoding': 'gzip, deflate'}
+    cache = gethttpcache(db, url)
+    if cache:
+        if cache['etag']:
+            headers['If-None-Match'] = cache['etag']
+        if cache['lastmodified']:
+            headers['If-Modified-Since'] = cache['lastmodified']
+    return headers
+
+def request(url, headers, opener=openurl, timeout=None):
+    """ Returns the response, or None if it's not modified. """
+    kwargs = {} if timeout is None else {'timeout': timeout}
+    try:
+        return opener(url, headers=headers, **kwargs)
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return None
+        raise
+
+def fetchchart(url, headers, opener=openurl, timeout=None, parser=None):
+    """ Fetch and parse a chart. It doesn't touch the db, so it can run in a worker thread.
+    Returns ((etag, lastmodified), entries), or None if it's not modified. """
+    resp = request(url, headers, opener=opener, timeout=timeout)
+    if resp is None:
+        return None
+    validators = (resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+    return validators, list(chartiter(url, opener=lambda u: DecodedResponse(resp), parser=parser))
 
 def fileopen(filename):
     return open(filename, 'rb')
 
-def chartiter(charturl='https://imdb.com/chart/top', opener=openurl):
-    parser = imdb.ChartParser()
-    chartstr = str(opener(charturl).read(), 'utf-8')
-    parser.feed(chartstr)
-    yield from iter(parser)
-
-def download(db, *args):
-    return _import(db, list(chartiter()))
+# Bytes read from the chart at a time.
+chunksize = 1 << 16
+
+def chartiter(charturl=defaulturl, opener=openurl, parser=None):
+    """ yield chart entries as they're parsed, while the chart is still being read. """
+    if parser is None:
+        parser = imdb.FastChartParser()
+    # Incremental, as a chunk may end part way through a multibyte character.
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with opener(charturl) as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            parser.feed(decoder.decode(chunk))
+            yield from parser
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser
+
+def downloadall(db, sources=None, workers=4, opener=openurl):
+    """ Fetch chart sources, all the enabled ones by default, concurrently and import each one as soon as
+    its fetch completes. Fetching and parsing happen in the pool, the db is only used from this thread.
+    yield (source, result) in completion order, result is what _import returned or the exception the source failed with.
+    Each source is imported in its own savepoint, so a failed source leaves nothing behind. """
+    if sources is None:
+        sources = chartsource.getsources(db, enabled=True)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(fetchchart, s['url'], conditionalheaders(db, s['url']), opener=opener, timeout=s['timeout'],
+            parser=imdb.parsers[s['parser']]()): s for s in sources}
+        for f in concurrent.futures.as_completed(futures):
+            source = futures[f]
+            try:
+                fetched = f.result()
+                if fetched is None:
+                    result = None
+                else:
+                    validators, entries = fetched
+                    with db.savepoint('chartsource'):
+                        result = _import(db, entries, sourceid=source['sourceid'])
+                        # Only once it's imported, otherwise a failed chart would be "not modified" from then on.
+                        sethttpcache(db, source['url'], *validators)
+            except Exception as e:
+                result = e
+            yield source, result
 
 def fileimport(db, filename='chart.html'):
-    return _import(db, list(chartiter(charturl=filename, opener=fileopen)))
+    return _import(db, chartiter(charturl=filename, opener=fileopen))
 
-def dlchart(db, outfile='chart.html', charturl='https://imdb.com/chart/top'):
+def dlchart(db, outfile='chart.html', charturl=defaulturl):
     with open(outfile, 'wb') as f:
         f.write(openurl(url=charturl).read())
 
-def addsync(db, date):
-    return dbutil.insert(db, 'INSERT INTO sync (whensynced) VALUES (?)', date)
+def addsync(db, date, charthash=None, sourceid=None):
+    return dbutil.insert(db, 'INSERT INTO sync (whensynced, charthash, sourceid) VALUES (?, ?, ?)', date, charthash, sourceid)
 
 def addrank(db, position, movieid, syncid):
     return dbutil.insert(db, 'INSERT INTO rank (indexnum, movieid, asat) VALUES (?, ?, ?)', position, movieid, syncid)
 
-def _import(db, entries):
-    if not entries:
+def charthash(entries, h):
+    """ Pass the entries through, adding them to hash h. """
+    for title, year, info in entries:
+        h.update('{}\t{}\t{}\n'.format(title, year, info).encode('utf-8'))
+        yield title, year, info
+
+def _import(db, entries, sourceid=None):
+    """ Import an iterable of (title, year, info) chart entries. Entries are staged as they arrive.
+    Returns (added movies, new rank ids), or None if the chart is the same as the source's last sync.
+    sourceid defaults to the top chart. """
+    sourceid = chartsource.resolve(db, sourceid)
+    h = hashlib.sha256()
+    # Stage the chart, then resolve it against the movie table as a set.
+    dbutil.insert(db, '''CREATE TEMP TABLE IF NOT EXISTS chartstage (
+            indexnum INTEGER PRIMARY KEY, title TEXT NOT NULL, yearmade INTEGER, notes TEXT, mkey TEXT NOT NULL)''')
+    dbutil.insert(db, 'DELETE FROM chartstage')
+    staged = dbutil.insertmany(db, 'INSERT INTO chartstage (indexnum, title, yearmade, notes, mkey) VALUES (?, ?, ?, ?, ?)',
+            ((i, title, year, info, movie.makekeytitle(title)) for i, (title, year, info) in enumerate(charthash(entries, h), 1)))
+    if not staged:
         raise Exception('Parse yields no results')
-    # Add a sync date entry.
-    now = int(time.time())
-    syncid = addsync(db, now)
-    # Import each movie title.
-    addedmovies = []
-    newrankings = []
-    for i, (title, year, info) in enumerate(entries, 1):
-        # Get an existing movie entry, create if it doesn't exist.
-        mov = movie.getmovie(db, title, year)
-        if mov:
-            movieid = mov['movieid']
-        else:
-            movieid = movie.addmovie(db, title, year, info, now)
-            addedmovies.append({'movieid': movieid, 'title': title, 'yearmade': year, 'notes': info, 'indexnum': i})
-        # Add a ranking.
-        rankid = addrank(db, i, movieid, now)
-        newrankings.append(rankid)
+    last = getlastsync(db, sourceid=sourceid)
+    if last and last['charthash'] == h.hexdigest():
+        dbutil.insert(db, 'DELETE FROM chartstage')
+        return None
+    # Add a sync date entry. Ranks are keyed on it, so several charts synced in the same second get later times.
+    now = max(int(time.time()), dbutil.getone(db, 'SELECT IFNULL(MAX(whensynced), 0) + 1 FROM sync')[0])
+    syncid = addsync(db, now, h.hexdigest(), sourceid)
+    lastmovieid = dbutil.getone(db, 'SELECT IFNULL(MAX(movieid), 0) FROM movie')[0]
+    # Add movies that we haven't seen before. A title may appear more than once in a chart so only
+    # the first (highest ranked) entry is used.
+    dbutil.insert(db, '''INSERT INTO movie (title, yearmade, notes, whenadded, mkey)
+            SELECT s.title, s.yearmade, s.notes, ?, s.mkey FROM chartstage s
+            WHERE NOT EXISTS (SELECT 1 FROM movie m WHERE m.title = s.title AND m.yearmade = s.yearmade)
+            AND s.indexnum = (SELECT MIN(d.indexnum) FROM chartstage d WHERE d.title = s.title AND d.yearmade = s.yearmade)
+            ORDER BY s.indexnum''', now)
+    # Rank every entry against its (first) movie entry.
+    dbutil.insert(db, '''INSERT INTO rank (indexnum, movieid, asat)
+            SELECT s.indexnum, (SELECT MIN(m.movieid) FROM movie m WHERE m.title = s.title AND m.yearmade = s.yearmade), ?
+            FROM chartstage s ORDER BY s.indexnum''', now)
+    addedmovies = [dict(r) for r in dbutil.getall(db, '''SELECT m.movieid, m.title, m.yearmade, m.notes, MIN(s.indexnum) AS indexnum
+            FROM chartstage s JOIN movie m ON m.title = s.title AND m.yearmade = s.yearmade
+            WHERE m.movieid > ? GROUP BY m.movieid ORDER BY indexnum''', lastmovieid)]
+    newrankings = [r[0] for r in dbutil.getall(db, 'SELECT rankid FROM rank WHERE asat = ? ORDER BY indexnum', now)]
+    dbutil.insert(db, 'DELETE FROM chartstage')
     return addedmovies, newrankings
 
-def getlastsync(db):
-    return dbutil.getlast(db, 'sync')
+def getlastsync(db, sourceid=None):
+    """ The latest sync of a chart source, the top chart by default. """
+    return dbutil.getone(db, 'SELECT * FROM sync WHERE sourceid = ? ORDER BY syncid DESC LIMIT 1', chartsource.resolve(db, sourceid))
 
-def getrankings(db, asat=None):
+def getrankings(db, asat=None, sourceid=None):
+    """ Rankings as at asat, or the latest of the chart source (the top chart by default). """
     if asat is None:
-        asat = getlastsync(db)['whensynced']
+        asat = getlastsync(db, sourceid=sourceid)['whensynced']
     return dbutil.getall(db, 'SELECT r.indexnum, m.* FROM rank r jOIN movie m ON r.movieid = m.movieid WHERE r.asat = ? ORDER BY r.indexnum', asat)
 
 def gethistory(db):
     """ get the sync history """
-    return dbutil.getall(db, 'SELECT * FROM sync')
+    return dbutil.iterall(db, 'SELECT * FROM sync ORDER BY syncid')
 
-def getrankingpair(db):
-    # Grab the last two sync timestamps.
-    syncold, syncnew = gethistory(db)[-2:]
+def getrankingpair(db, sourceid=None):
+    # Grab the chart source's last two sync timestamps.
+    syncnew, syncold = dbutil.getall(db, 'SELECT * FROM sync WHERE sourceid = ? ORDER BY syncid DESC LIMIT 2', chartsource.resolve(db, sourceid))
     rankold = getrankings(db, asat=syncold['whensynced'])
     ranknew = getrankings(db, asat=syncnew['whensynced'])
     return rankold, ranknew
 
-def getpunted(db):
+def getpunted(db, sourceid=None):
     try:
-        rankold, ranknew = getrankingpair(db)
+        rankold, ranknew = getrankingpair(db, sourceid=sourceid)
     except ValueError:
         return []
     else:
         puntedids = {m['movieid'] for m in rankold} - {m['movieid'] for m in ranknew}
         return [m for m in rankold if m['movieid'] in puntedids]
 
-def getdiffs(db):
+def getdiffs(db, sourceid=None):
     try:
-        rankold, ranknew = getrankingpair(db)
+        rankold, ranknew = getrankingpair(db, sourceid=sourceid)
     except ValueError:
         return
     # Build a difflist for entries in ranknew.
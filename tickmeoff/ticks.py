@@ -8,4 +8,4 @@ def markmovie(db, movie):
     dbutil.insert(db, 'INSERT INTO ticks (movieid, datetime) VALUES (?, ?)', movie['movieid'], int(time.time()))
 
 def getmarks(db):
-    return dbutil.getall(db, 'SELECT * FROM ticks t JOIN movie m ON (t.movieid = m.movieid)')
+    return dbutil.iterall(db, 'SELECT * FROM ticks t JOIN movie m ON (t.movieid = m.movieid) ORDER BY t.datetime')